@@ -0,0 +1,69 @@
+import re
+from typing import List
+from langchain_text_splitters import CharacterTextSplitter, TextSplitter
+
+# Top-level lines that open a section: record fields ("Specifications:",
+# "Applications: ...", "Step 1: ...") and numbered steps ("2. Cutting and Installation")
+SECTION_START = re.compile(r"^(?:[A-Z][A-Za-z /&()-]*:(?: |$)|\d+\.\s)")
+
+class StructuredChunker(TextSplitter):
+    """Splits formatted records along their fields instead of at character counts.
+
+    The first line of a document (formatters put its name and id there) is
+    its header. Sections are packed whole into chunks of up to `chunk_size`
+    characters, and every chunk after the first starts with the header, so
+    no chunk loses track of the record it belongs to. Chunks meet at section
+    boundaries and share no text; only a section too large for one chunk is
+    cut by lines, with `chunk_overlap` between its pieces.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, **kwargs):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+    @staticmethod
+    def split_sections(text: str) -> List[str]:
+        """The document's lines grouped into sections; the first holds everything before the first field."""
+        sections: List[List[str]] = [[]]
+        for line in text.strip().splitlines():
+            if SECTION_START.match(line) and sections[-1]:
+                sections.append([])
+            sections[-1].append(line)
+        return ["\n".join(lines) for lines in sections if lines]
+
+    def _split_oversized(self, section: str, header: str) -> List[str]:
+        room = max(self._chunk_size - self._length_function(header) - 1, 1)
+        splitter = CharacterTextSplitter(
+            separator="\n",
+            chunk_size=room,
+            chunk_overlap=min(self._chunk_overlap, room // 2),
+            length_function=self._length_function
+        )
+        return splitter.split_text(section)
+
+    def split_text(self, text: str) -> List[str]:
+        sections = self.split_sections(text)
+        if not sections:
+            return []
+        header = sections[0].split("\n", 1)[0]
+
+        def with_header(body: str) -> str:
+            return body if body == header or body.startswith(header + "\n") else f"{header}\n{body}"
+
+        chunks: List[str] = []
+        current = ""
+        for section in sections:
+            candidate = f"{current}\n{section}" if current else with_header(section)
+            if self._length_function(candidate) <= self._chunk_size:
+                current = candidate
+                continue
+            if current:
+                chunks.append(current)
+            current = with_header(section)
+            if self._length_function(current) > self._chunk_size:
+                # One section larger than a chunk: cut it by lines
+                pieces = [with_header(piece) for piece in self._split_oversized(section, header)]
+                chunks.extend(pieces[:-1])
+                current = pieces[-1] if pieces else ""
+        if current:
+            chunks.append(current)
+        return chunks
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from services.token_counter import count_tokens
+
+try:
+    import openai
+    RETRYABLE_ERRORS: Tuple[type, ...] = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )
+except ImportError:
+    RETRYABLE_ERRORS = (TimeoutError, ConnectionError)
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        """Block until `amount` tokens are available, then take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+def make_batches(documents: Iterable[Dict[str, Any]],
+                 max_batch_size: int = 256,
+                 max_batch_tokens: int = 100_000,
+                 model: str = "text-embedding-ada-002") -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """Group documents into batches bounded by both item count and token count."""
+    batch, batch_tokens = [], 0
+    for doc in documents:
+        tokens = count_tokens(doc['content'], model)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+class EmbeddingPipeline:
+    """Embed documents in concurrent, rate-limited batches and hand each batch to a writer.
+
+    Batches are written as soon as they finish, so an interrupted import
+    keeps everything written so far; rerunning an incremental build diffs
+    against the table and resumes with the remaining chunks.
+    """
+
+    def __init__(self, embeddings: Embeddings,
+                 max_workers: int = 4,
+                 max_batch_size: int = 256,
+                 max_batch_tokens: int = 100_000,
+                 tokens_per_minute: float = 1_000_000,
+                 requests_per_minute: float = 3_000,
+                 max_retries: int = 6,
+                 base_backoff: float = 1.0):
+        self.embeddings = embeddings
+        self.max_workers = max_workers
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return getattr(self.embeddings, 'model', None) or "text-embedding-ada-002"
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Honor Retry-After when the API sends it, otherwise exponential backoff with jitter."""
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            if retry_after:
+                return float(retry_after)
+        except ValueError:
+            pass
+        return self.base_backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def _embed_batch(self, batch: List[Dict[str, Any]], tokens: int) -> List[List[float]]:
+        texts = [doc['content'] for doc in batch]
+        for attempt in range(self.max_retries + 1):
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(texts)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                with self._lock:
+                    self._retries += 1
+                print(f"Warning: embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, documents: Iterable[Dict[str, Any]],
+            write_batch: Callable[[List[Dict[str, Any]], List[List[float]]], None]) -> Dict[str, float]:
+        """Embed all documents and stream finished batches to `write_batch`; return a throughput report."""
+        start = time.perf_counter()
+        chunks, tokens, batches = 0, 0, 0
+        pending = {}
+        batch_iter = make_batches(documents, self.max_batch_size, self.max_batch_tokens, self.model)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+            def submit_next() -> bool:
+                for batch, batch_tokens in batch_iter:
+                    future = executor.submit(self._embed_batch, batch, batch_tokens)
+                    pending[future] = (batch, batch_tokens)
+                    return True
+                return False
+
+            # Keep a bounded window of batches in flight
+            while len(pending) < self.max_workers * 2 and submit_next():
+                pass
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, batch_tokens = pending.pop(future)
+                    write_batch(batch, future.result())
+                    chunks += len(batch)
+                    tokens += batch_tokens
+                    batches += 1
+                    submit_next()
+
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        report = {
+            'chunks': chunks,
+            'tokens': tokens,
+            'batches': batches,
+            'retries': self._retries,
+            'seconds': elapsed,
+            'chunks_per_second': chunks / elapsed,
+            'tokens_per_second': tokens / elapsed
+        }
+        if chunks:
+            print(f"Embedded {chunks} chunks ({tokens} tokens, {batches} batches) in {elapsed:.1f}s: "
+                  f"{report['chunks_per_second']:.1f} chunks/s, {report['tokens_per_second']:.0f} tokens/s, "
+                  f"{self._retries} retries")
+        return report
@@ -0,0 +1,124 @@
+import os
+import json
+from collections import defaultdict
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+ID_INDEX_FILE = "id_index.json"
+
+# Order linked chunks are returned in, after any doc types the query asks for
+BUNDLE_ORDER = [
+    "product",
+    "safety_document",
+    "installation_guide",
+    "technical_document",
+    "building_code",
+    "material_alternative",
+    "typical_query"
+]
+
+def record_links(data_type: str, item: Dict[str, Any]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Ids a record's chunks are indexed under, and the cross-links the record declares."""
+    def ids(values) -> List[str]:
+        return [str(value) for value in values or [] if value]
+
+    if data_type == 'product_catalog':
+        return ids([item.get('id')]), []
+    if data_type in ('technical_documents', 'safety_documents', 'installation_guides'):
+        own_id = item.get('id') or item.get('doc_id') or item.get('guide_id')
+        return ids([own_id]), [(str(own_id), p) for p in ids([item.get('product_id')]) if own_id]
+    if data_type == 'building_codes':
+        code_id = item.get('code_id')
+        return ids([code_id]), [(str(code_id), p) for p in ids(item.get('applicable_products')) if code_id]
+    if data_type == 'material_alternatives':
+        # Indexed under each alternative, so naming one finds the comparison
+        alternatives = ids(alternative.get('id') for alternative in item.get('alternatives', []))
+        primary = item.get('primary_product_id')
+        return alternatives, [(str(primary), a) for a in alternatives if primary]
+    if data_type == 'typical_queries':
+        products = ids(item.get('relevant_products'))
+        others = ids(item.get('relevant_codes')) + ids(item.get('relevant_documents'))
+        return [], [(p, o) for p in products for o in others]
+    return [], []
+
+class IdIndex:
+    """Inverted index from source ids (SKUs, code, document and guide ids) to chunk ids,
+    plus an undirected graph of the cross-links between those ids.
+
+    Built while ingesting and stored next to the index manifest, so naming an
+    id in a query resolves its chunks and those of its direct neighbours
+    (a product's safety docs, installation guides, codes and alternatives)
+    with dictionary lookups.
+    """
+
+    def __init__(self):
+        self.chunks: Dict[str, List[Tuple[str, str]]] = defaultdict(list)  # id -> [(doc_type, chunk id)]
+        self.links: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def clear(self):
+        self.chunks.clear()
+        self.links.clear()
+
+    @property
+    def ids(self) -> Set[str]:
+        return set(self.chunks) | set(self.links)
+
+    def add_document(self, document: Dict[str, Any]):
+        """Index a chunk from BuildingDataProcessor.iter_documents."""
+        doc_type = document['metadata'].get('doc_type')
+        for entity_id in document.get('entities', []):
+            entry = (doc_type, document['id'])
+            if entry not in self.chunks[entity_id]:
+                self.chunks[entity_id].append(entry)
+        for a, b in document.get('links', []):
+            if a != b:
+                self.links[a].add(b)
+                self.links[b].add(a)
+
+    def bundle(self, ids: Iterable[str], doc_types_first: Optional[List[str]] = None,
+               limit: int = 6) -> List[str]:
+        """Chunk ids for the given ids and their direct neighbours, most relevant first.
+
+        Chunks of `doc_types_first` (what the query asks for) lead; after
+        that the named ids' own chunks come before their neighbours', each
+        in BUNDLE_ORDER.
+        """
+        ids = list(dict.fromkeys(ids))
+        preferred = set(doc_types_first or [])
+        rank = {doc_type: i for i, doc_type in enumerate(BUNDLE_ORDER)}
+        neighbours = sorted({n for entity_id in ids for n in self.links.get(entity_id, ())} - set(ids))
+
+        entries = []
+        for distance, entity_ids in enumerate((ids, neighbours)):
+            for entity_id in entity_ids:
+                for doc_type, chunk_id in self.chunks.get(entity_id, []):
+                    key = (doc_type not in preferred, distance, rank.get(doc_type, len(rank)))
+                    entries.append((key, chunk_id))
+        entries.sort(key=lambda entry: entry[0])
+        return list(dict.fromkeys(chunk_id for _, chunk_id in entries))[:limit]
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({
+                'chunks': self.chunks,
+                'links': {entity_id: sorted(links) for entity_id, links in self.links.items()}
+            }, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IdIndex":
+        """Load a saved index, or return an empty one if there is none."""
+        index = cls()
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return index
+        for entity_id, entries in data.get('chunks', {}).items():
+            index.chunks[entity_id] = [tuple(entry) for entry in entries]
+        for entity_id, links in data.get('links', {}).items():
+            index.links[entity_id] = set(links)
+        return index
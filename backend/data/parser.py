@@ -1,6 +1,174 @@
+import os
 import re
+import ast
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Iterator, Optional, TextIO, Tuple
+
+class _LiteralScanner:
+    """Incremental tokenizer for the Python-literal subset used by supplier dumps.
+
+    Reads the file in fixed-size chunks and only keeps the unconsumed tail in
+    memory, so memory use is bounded by the largest single record.
+    """
+
+    WHITESPACE = re.compile(r'(?:\s+|#[^\n]*)+')
+    NUMBER = re.compile(r'[-+]?(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][-+]?\d+)?')
+    NAME = re.compile(r'[A-Za-z_]\w*')
+    STRING_PREFIX = re.compile(r'[rRuUbB]{1,2}(?=["\'])')
+    STRING_BODIES = {
+        '"""': re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""', re.S),
+        "'''": re.compile(r"'''(?:[^'\\]|\\.|'(?!''))*'''", re.S),
+        '"': re.compile(r'"(?:[^"\\\n]|\\.)*"'),
+        "'": re.compile(r"'(?:[^'\\\n]|\\.)*'")
+    }
+    CONSTANTS = {'True': True, 'False': False, 'None': None, 'true': True, 'false': False, 'null': None}
+
+    def __init__(self, file: TextIO, chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0  # absolute position of buf[0] in the file
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Drop consumed input and read the next chunk; return False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            # Keep the buffer as is: callers may hold a match against it
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _ensure(self, count: int) -> bool:
+        while len(self.buf) - self.pos < count:
+            if not self._fill():
+                return False
+        return True
+
+    def _match(self, pattern: re.Pattern) -> Optional[re.Match]:
+        """Match `pattern` at the cursor, reading more input while the match could be truncated.
+
+        All token patterns decide within a few characters whether they can
+        match at all, so a failed match never reads ahead more than that. A
+        match also needs a few characters of lookahead, since a number cut
+        at a chunk boundary (`1.5e` | `3`) would otherwise stop short.
+        """
+        self._ensure(3)
+        while True:
+            match = pattern.match(self.buf, self.pos)
+            if not match or match.end() + 3 <= len(self.buf) or not self._fill():
+                return match
+
+    def error(self, message: str) -> ValueError:
+        return ValueError(f"{message} at offset {self.offset + self.pos}")
+
+    def peek(self) -> str:
+        """Skip whitespace and comments; return the next character ('' at end of input)."""
+        while True:
+            if not self._ensure(1):
+                return ''
+            if not (self.buf[self.pos].isspace() or self.buf[self.pos] == '#'):
+                return self.buf[self.pos]
+            match = self._match(self.WHITESPACE)
+            if match and match.end() > self.pos:
+                self.pos = match.end()
+                continue
+            return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise self.error(f"Expected {char!r}")
+        self.pos += 1
+
+    def skip_to(self, pattern: re.Pattern):
+        """Discard input up to and including the first match of `pattern`."""
+        keep = 256
+        while True:
+            match = pattern.search(self.buf, self.pos)
+            if match and (match.end() < len(self.buf) or self.eof):
+                self.pos = match.end()
+                return
+            self.pos = max(self.pos, len(self.buf) - keep)
+            if not self._fill():
+                raise self.error(f"Could not find {pattern.pattern!r}")
+
+    def _read_string(self) -> str:
+        prefix = ''
+        match = self._match(self.STRING_PREFIX)
+        if match:
+            prefix = match.group(0)
+            self.pos = match.end()
+        self._ensure(3)
+        quote = self.buf[self.pos:self.pos + 3]
+        if quote not in ('"""', "\'\'\'"):
+            quote = quote[:1]
+
+        pattern = self.STRING_BODIES[quote]
+        while True:
+            match = pattern.match(self.buf, self.pos)
+            if match:
+                break
+            if not self._fill():
+                raise self.error("Unterminated string")
+        self.pos = match.end()
+        literal = match.group(0)
+        if not prefix and '\\' not in literal:
+            # Nothing to unescape, skip the compile in literal_eval
+            return literal[len(quote):-len(quote)]
+        return ast.literal_eval(prefix + literal)
+
+    def read_string(self) -> str:
+        """Read one string, joining adjacent literals the way Python does."""
+        value = self._read_string()
+        while self.peek() in ('"', "'"):
+            value += self._read_string()
+        return value
+
+    def read_value(self) -> Any:
+        char = self.peek()
+        if char == '{':
+            self.pos += 1
+            result = {}
+            while self.peek() != '}':
+                key = self.read_value()
+                self.expect(':')
+                result[key] = self.read_value()
+                if self.peek() == ',':
+                    self.pos += 1
+                elif self.peek() != '}':
+                    raise self.error("Expected ',' or '}'")
+            self.pos += 1
+            return result
+        if char in '[(' and char:
+            closing = ']' if char == '[' else ')'
+            self.pos += 1
+            result = []
+            while self.peek() != closing:
+                result.append(self.read_value())
+                if self.peek() == ',':
+                    self.pos += 1
+                elif self.peek() != closing:
+                    raise self.error(f"Expected ',' or {closing!r}")
+            self.pos += 1
+            return result
+        if char in ('"', "'") or self.STRING_PREFIX.match(self.buf, self.pos):
+            return self.read_string()
+
+        match = self._match(self.NUMBER)
+        if match and match.end() > self.pos:
+            self.pos = match.end()
+            return ast.literal_eval(match.group(0).replace('_', ''))
+        match = self._match(self.NAME)
+        if match and match.group(0) in self.CONSTANTS:
+            self.pos = match.end()
+            return self.CONSTANTS[match.group(0)]
+        raise self.error(f"Unexpected input {self.buf[self.pos:self.pos + 20]!r}")
 
 class BuildingDataParser:
     def __init__(self):
@@ -37,6 +205,63 @@ class BuildingDataParser:
             print(f"Error parsing file: {str(e)}")
             return None
     
+    def iter_records(self, file_path: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+        """Stream the dataset as (section, record) pairs without loading the whole file.
+
+        Each element of a top-level list (product_catalog, technical_documents,
+        ...) is yielded on its own; non-list sections are yielded whole.
+        """
+        with open(file_path, 'r', encoding='utf-8-sig') as file:
+            scanner = _LiteralScanner(file, chunk_size)
+            scanner.skip_to(re.compile(r'sample_dataset\s*=\s*'))
+            scanner.expect('{')
+            while scanner.peek() != '}':
+                section = scanner.read_value()
+                scanner.expect(':')
+                if scanner.peek() == '[':
+                    scanner.expect('[')
+                    while scanner.peek() != ']':
+                        yield section, scanner.read_value()
+                        if scanner.peek() != ']':
+                            scanner.expect(',')
+                    scanner.expect(']')
+                else:
+                    yield section, scanner.read_value()
+                if scanner.peek() != '}':
+                    scanner.expect(',')
+
+    def save_json_stream(self, records: Iterable[Tuple[str, Any]], output_path: str) -> bool:
+        """Write (section, record) pairs as a JSON object of lists, one record at a time.
+
+        Records of a section are expected to arrive together, as iter_records yields them.
+        The output is written to a temporary file and moved into place once complete, so
+        a parse error never leaves a truncated file behind.
+        """
+        temp_path = f"{output_path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                file.write('{')
+                current = None
+                for section, record in records:
+                    if section != current:
+                        if current is not None:
+                            file.write('\n  ],')
+                        file.write(f'\n  {json.dumps(section)}: [')
+                        current, first = section, True
+                    file.write('\n    ' if first else ',\n    ')
+                    file.write(json.dumps(record))
+                    first = False
+                if current is not None:
+                    file.write('\n  ]')
+                file.write('\n}\n')
+            os.replace(temp_path, output_path)
+            return True
+        except Exception as e:
+            print(f"Error saving JSON: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
     def save_json(self, data: Dict[str, Any], output_path: str) -> bool:
         """Save the parsed data as a JSON file."""
         try:
@@ -48,6 +273,8 @@ class BuildingDataParser:
             return False
 
 def main():
+    import sys
+    
     # Initialize parser
     parser = BuildingDataParser()
     
@@ -55,6 +282,14 @@ def main():
     input_file = "raw_data.txt"  
     output_file = "building_data.json"  
     
+    # Streaming mode keeps memory flat regardless of the input size
+    if "--stream" in sys.argv:
+        if parser.save_json_stream(parser.iter_records(input_file), output_file):
+            print(f"Successfully parsed and saved data to {output_file}")
+            return True
+        print("Failed to parse input file")
+        return None
+    
     # Parse and save data
     data = parser.parse_file(input_file)
     if data:
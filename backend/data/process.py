@@ -1,204 +1,716 @@
 import os
-from typing import Dict, Any, List
+import sys
+from functools import partial
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import LanceDB
-from langchain_text_splitters import CharacterTextSplitter
+from langchain_text_splitters import TextSplitter
+from contextlib import contextmanager
+import fcntl
+import hashlib
 import json
+import textwrap
+import time
+import unicodedata
 import pandas as pd
+import pyarrow as pa
 import lancedb
-from uuid import uuid4
 
-class BuildingDataProcessor:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.text_splitter = CharacterTextSplitter(
-            separator="\n",
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(DATA_DIR)
+if BACKEND_DIR not in sys.path:
+    # Allow `python process.py` from backend/data as well as `import data.process`
+    sys.path.insert(0, BACKEND_DIR)
+
+from data.chunker import StructuredChunker
+from data.embedding_pipeline import EmbeddingPipeline
+from data.id_index import ID_INDEX_FILE, IdIndex, record_links
+from data.parser import BuildingDataParser
+from data.stages import batched, bounded_map, make_executor, prefetch
+from data.vector_export import export_table, import_export, load_export_manifest
+from services.embedding_cache import CachedEmbeddings
+
+CLEAN_DATA_PATH = os.path.join(DATA_DIR, "clean_data.json")
+# Overridable so load tests and CI can build a throwaway index
+DB_PATH = os.getenv("BUILDMATE_DB_PATH", os.path.join(DATA_DIR, "tmp", "building_materials_db"))
+EXPORT_DIR = os.getenv("BUILDMATE_EXPORT_DIR", os.path.join(DATA_DIR, "building_materials_export"))
+TABLE_NAME = "building_materials"
+FTS_COLUMN = "text"
+
+# Below ANN_MIN_ROWS a flat scan is exact and fast enough; above it an ANN
+# index is built. Tune with test/ann_benchmark.py.
+ANN_MIN_ROWS = 10_000
+ANN_INDEX_CONFIG = {
+    "index_type": "IVF_PQ",
+    "num_partitions": None,  # default: sqrt(rows)
+    "num_sub_vectors": None  # default: about dimension / 16
+}
+# Incremental builds fold new rows into the existing ANN index; it is retrained
+# from scratch once the table has grown by this share since its last training
+ANN_RETRAIN_GROWTH = 0.2
+ANN_SEARCH_PARAMS = {
+    "nprobes": 20,
+    "refine_factor": 10  # re-rank refine_factor * k candidates with exact distances
+}
+MANIFEST_NAME = "manifest.json"
+# Bump when the formatters or normalization change: every chunk id changes with
+# its text, so the next build re-embeds the table and replaces the old rows
+DOCUMENT_FORMAT = 3
+
+# Union of the metadata fields every doc type can set, so batches written
+# independently share one table schema
+METADATA_SCHEMA = pa.struct([
+    ('doc_type', pa.string()),
+    ('product_id', pa.string()),
+    ('category', pa.string()),
+    ('manufacturer', pa.string()),
+    ('doc_id', pa.string()),
+    ('code_id', pa.string()),
+    ('guide_id', pa.string()),
+    ('jurisdiction', pa.string()),
+    ('applicable_products', pa.list_(pa.string())),
+    ('relevant_products', pa.list_(pa.string())),
+    ('relevant_codes', pa.list_(pa.string())),
+    ('relevant_documents', pa.list_(pa.string()))
+])
+
+def table_schema(dimension: int) -> pa.Schema:
+    """Schema of the vector table, matching the columns LangChain's LanceDB store reads."""
+    return pa.schema([
+        ('vector', pa.list_(pa.float32(), dimension)),
+        ('id', pa.string()),
+        ('text', pa.string()),
+        ('metadata', METADATA_SCHEMA)
+    ])
+
+def source_fingerprint(source_path: str) -> str:
+    """Return the sha256 hex digest of the source data file."""
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """Load the index manifest written by the last successful build, if any."""
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def manifest_version(db_path: str = DB_PATH) -> Optional[str]:
+    """Cheaply identify the current index build (changes whenever the manifest is rewritten)."""
+    try:
+        return str(os.stat(os.path.join(db_path, MANIFEST_NAME)).st_mtime_ns)
+    except OSError:
+        return None
+
+def write_manifest(db_path: str, manifest: Dict[str, Any]) -> None:
+    """Atomically write the index manifest next to the LanceDB tables."""
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def is_index_current(source_path: str = CLEAN_DATA_PATH,
+                     db_path: str = DB_PATH,
+                     table_name: str = TABLE_NAME,
+                     embedding_model: Optional[str] = None) -> bool:
+    """Check whether the persisted table was built from the current source data."""
+    manifest = load_manifest(db_path)
+    if not manifest:
+        return False
+    if manifest.get('table_name') != table_name:
+        return False
+    if embedding_model and manifest.get('embedding_model') != embedding_model:
+        return False
+    if manifest.get('document_format') != DOCUMENT_FORMAT:
+        # Built with an older document format; the incremental build migrates it
+        return False
+    if not os.path.isdir(os.path.join(db_path, f"{table_name}.lance")):
+        return False
+    return manifest.get('source_sha256') == source_fingerprint(source_path)
+
+def is_export_current(source_path: str = CLEAN_DATA_PATH,
+                      export_dir: str = EXPORT_DIR,
+                      embedding_model: Optional[str] = None) -> bool:
+    """Check whether the binary vector export was built from the current source data."""
+    manifest = load_export_manifest(export_dir)
+    if not manifest:
+        return False
+    if embedding_model and manifest.get('embedding_model') != embedding_model:
+        return False
+    if manifest.get('document_format') != DOCUMENT_FORMAT:
+        return False
+    return manifest.get('source_sha256') == source_fingerprint(source_path)
+
+def _content_hash(text: str, length: int = 12) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:length]
+
+def source_document_id(doc_type: str, source_id: Any, content: str) -> str:
+    """Deterministic id for a source record, e.g. `product:LUM-2x4-8-PT`.
+
+    Records without a natural id (typical queries) fall back to a hash of
+    their formatted content.
+    """
+    if source_id is None or source_id == '':
+        source_id = _content_hash(content)
+    elif not isinstance(source_id, str) or len(source_id) > 64:
+        source_id = _content_hash(str(source_id))
+    return f"{doc_type}:{source_id}"
+
+def chunk_id(document_id: str, index: int, chunk: str) -> str:
+    """Chunk id from its source record, position and content; changes only when the chunk does."""
+    return f"{document_id}:{index}:{_content_hash(chunk)}"
+
+def ensure_fts_index(table, column: str = FTS_COLUMN) -> bool:
+    """(Re)build the full-text index used for keyword and hybrid search."""
+    try:
+        table.create_fts_index(column, replace=True)
+        return True
+    except Exception as e:
+        print(f"Warning: could not build full-text index: {str(e)}")
+        return False
+
+def ensure_id_index(table) -> bool:
+    """Scalar index on the chunk id column, for direct lookups by id."""
+    try:
+        table.create_scalar_index("id", replace=True)
+        return True
+    except Exception as e:
+        print(f"Warning: could not build id index: {str(e)}")
+        return False
+
+def default_sub_vectors(dimension: int) -> int:
+    """Largest divisor of `dimension` up to dimension / 16 (PQ needs an even split)."""
+    return next(n for n in range(max(dimension // 16, 1), 0, -1) if dimension % n == 0)
+
+def ensure_vector_index(table,
+                        min_rows: int = ANN_MIN_ROWS,
+                        index_type: str = ANN_INDEX_CONFIG["index_type"],
+                        num_partitions: Optional[int] = ANN_INDEX_CONFIG["num_partitions"],
+                        num_sub_vectors: Optional[int] = ANN_INDEX_CONFIG["num_sub_vectors"]) -> Optional[str]:
+    """Build an ANN index on the vector column once the table has `min_rows` rows.
+
+    Returns the index type built, or None if the table is still searched by flat scan.
+    """
+    rows = table.count_rows()
+    if rows < min_rows:
+        return None
+    dimension = table.schema.field("vector").type.list_size
+    options = {"num_partitions": num_partitions or max(1, int(rows ** 0.5))}
+    if index_type.endswith("PQ"):
+        options["num_sub_vectors"] = num_sub_vectors or default_sub_vectors(dimension)
+
+    start = time.perf_counter()
+    try:
+        table.create_index(metric="l2", vector_column_name="vector", index_type=index_type, replace=True, **options)
+    except Exception as e:
+        print(f"Warning: could not build {index_type} index, using flat search: {str(e)}")
+        return None
+    print(f"Built {index_type} index over {rows} rows {options} in {time.perf_counter() - start:.1f}s")
+    return index_type
+
+def refresh_indexes(table, rebuild: bool = True,
+                    vector_index: Optional[str] = None,
+                    trained_rows: Optional[int] = None) -> Tuple[Optional[str], Optional[int]]:
+    """Bring the full-text, id and ANN indexes up to date with the table's rows.
+
+    A rebuild (re)creates every index. Otherwise new rows are folded into the
+    existing indexes with optimize(), and the ANN index is only retrained
+    when the table first reaches ANN_MIN_ROWS or has grown by
+    ANN_RETRAIN_GROWTH since `trained_rows`. `vector_index` and
+    `trained_rows` come from the previous manifest. Returns the vector index
+    type (None for flat search) and the row count it was trained on.
+    """
+    indices = {index.columns[0]: index.index_type for index in table.list_indices()}
+    if not rebuild:
+        try:
+            table.optimize()
+        except Exception as e:
+            print(f"Warning: could not update indexes in place, rebuilding them: {str(e)}")
+            rebuild = True
+    if rebuild or FTS_COLUMN not in indices:
+        ensure_fts_index(table)
+    if rebuild or 'id' not in indices:
+        ensure_id_index(table)
+
+    if 'vector' not in indices:
+        vector_index = None
+    rows = table.count_rows()
+    if rebuild or vector_index is None or trained_rows is None or rows > trained_rows * (1 + ANN_RETRAIN_GROWTH):
+        vector_index = ensure_vector_index(table)
+        trained_rows = rows if vector_index else None
+    return vector_index, trained_rows
+
+@contextmanager
+def index_lock(db_path: str = DB_PATH):
+    """Serialize index checks and rebuilds across worker processes."""
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, ".lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# doc_type -> function turning a source record into document text
+FORMATTERS: Dict[str, Callable[[Dict[str, Any]], str]] = {}
+
+def register_formatter(*doc_types: str):
+    """Decorator registering a content formatter for one or more doc types."""
+    def decorator(func: Callable[[Dict[str, Any]], str]) -> Callable[[Dict[str, Any]], str]:
+        for doc_type in doc_types:
+            FORMATTERS[doc_type] = func
+        return func
+    return decorator
+
+def _field(key: Any, value: Any) -> str:
+    if isinstance(value, dict):
+        return f"{key}: ({_inline_value(value)})"
+    return f"{key}: {_inline_value(value)}"
+
+def _inline_value(obj: Any) -> str:
+    """Render a nested value on one line: `key: value, ...` for dicts, comma-joined lists."""
+    if isinstance(obj, dict):
+        return ", ".join(_field(key, value) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return ", ".join(
+            f"({_inline_value(item)})" if isinstance(item, (dict, list, tuple)) else _inline_value(item)
+            for item in obj if item is not None
         )
-        
-    def _sanitize_json(self, obj: Any) -> str:
-        """Safely convert JSON objects to formatted strings."""
+    return str(obj)
+
+def _format_value(obj: Any) -> str:
+    """Render a record field compactly: one `key: value` line per dict entry, one line per list item.
+
+    Replaces pretty-printed JSON, whose indentation and quoting were embedded,
+    stored and sent to the LLM with every chunk.
+    """
+    try:
+        if isinstance(obj, dict):
+            return "\n".join(_field(key, value) for key, value in obj.items())
+        if isinstance(obj, (list, tuple)) and any(isinstance(item, dict) for item in obj):
+            return "\n".join(
+                "; ".join(_field(key, value) for key, value in item.items())
+                if isinstance(item, dict) else _inline_value(item)
+                for item in obj if item is not None
+            )
+        return _inline_value(obj)
+    except Exception as e:
+        print(f"Warning: value formatting error: {str(e)}")
+        return str(obj)
+
+def _join_list_safely(items: List[str]) -> str:
+    """Safely join list items with proper handling of None and non-string types."""
+    if not items:
+        return ""
+    return ", ".join(str(item) for item in items if item is not None)
+
+def _lines(*lines: str) -> str:
+    return "\n".join(lines)
+
+@register_formatter("product")
+def format_product(document: Dict[str, Any]) -> str:
+    return _lines(
+        f"Product: {document.get('name', 'N/A')} (ID: {document.get('id', 'N/A')})",
+        f"Category: {document.get('category', 'N/A')}",
+        f"Manufacturer: {document.get('manufacturer', 'N/A')}",
+        "Specifications:",
+        _format_value(document.get('specifications', {})),
+        f"Applications: {_join_list_safely(document.get('applications', []))}",
+        "Technical Details:",
+        _format_value(document.get('technical_details', {})),
+        "Price History:",
+        _format_value(document.get('price_history', [])),
+        "Current Stock:",
+        _format_value(document.get('current_stock', {}))
+    )
+
+@register_formatter("technical_document", "installation_guide", "safety_document")
+def format_text_document(document: Dict[str, Any]) -> str:
+    return _lines(
+        f"{document.get('title', 'N/A')} (Product ID: {document.get('product_id', 'N/A')})",
+        "",
+        document.get('content', '')
+    )
+
+@register_formatter("building_code")
+def format_building_code(document: Dict[str, Any]) -> str:
+    return _lines(
+        f"{document.get('title', 'N/A')} ({document.get('code_id', 'N/A')})",
+        f"Jurisdiction: {document.get('jurisdiction', 'N/A')}",
+        "",
+        document.get('summary', '')
+    )
+
+@register_formatter("material_alternative")
+def format_material_alternative(document: Dict[str, Any]) -> str:
+    return _lines(
+        f"Material Alternatives for Product ID: {document.get('primary_product_id', 'N/A')}",
+        "Alternatives:",
+        _format_value(document.get('alternatives', []))
+    )
+
+@register_formatter("typical_query")
+def format_typical_query(document: Dict[str, Any]) -> str:
+    return _lines(
+        f"Query: {document.get('query', 'N/A')}",
+        f"Context: {document.get('context', 'N/A')}",
+        f"Relevant Products: {_join_list_safely(document.get('relevant_products', []))}",
+        f"Relevant Codes: {_join_list_safely(document.get('relevant_codes', []))}",
+        f"Relevant Documents: {_join_list_safely(document.get('relevant_documents', []))}",
+        f"Considerations: {_join_list_safely(document.get('considerations', []))}",
+        f"Key Points: {_join_list_safely(document.get('key_points', []))}"
+    )
+
+def normalize_text(text: str) -> str:
+    """NFC-normalize text, dedent it, strip trailing spaces and collapse runs of blank lines."""
+    text = unicodedata.normalize("NFC", text).replace("\t", "    ").replace("\u00a0", " ")
+    lines = textwrap.dedent(text).splitlines()
+    normalized = []
+    for line in lines:
+        line = line.rstrip()
+        if line or (normalized and normalized[-1]):
+            normalized.append(line)
+    return "\n".join(normalized).strip()
+
+def format_document_content(document: Dict[str, Any], doc_type: str) -> str:
+    """Format a source record with the formatter registered for its doc type."""
+    formatter = FORMATTERS.get(doc_type)
+    if formatter is None:
+        return str(document)
+    try:
+        return formatter(document)
+    except Exception as e:
+        print(f"Warning: Error formatting {doc_type} document: {str(e)}")
+        return str(document)
+
+def _product_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {'product_id': x['id'], 'category': x.get('category'), 'manufacturer': x.get('manufacturer')}
+
+def _document_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {'doc_id': x.get('id'), 'product_id': x.get('product_id')}
+
+def _building_code_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'code_id': x.get('code_id'),
+        'jurisdiction': x.get('jurisdiction'),
+        'applicable_products': x.get('applicable_products', [])
+    }
+
+def _installation_guide_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {'guide_id': x.get('guide_id'), 'product_id': x.get('product_id')}
+
+def _safety_document_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {'doc_id': x.get('doc_id'), 'product_id': x.get('product_id')}
+
+def _material_alternative_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {'product_id': x.get('primary_product_id')}
+
+def _typical_query_metadata(x: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'relevant_products': x.get('relevant_products', []),
+        'relevant_codes': x.get('relevant_codes', []),
+        'relevant_documents': x.get('relevant_documents', [])
+    }
+
+# Source section -> (doc_type, source id field, metadata). Module-level functions
+# so batches of records can be prepared in worker processes.
+PROCESSORS = {
+    'product_catalog': ('product', 'id', _product_metadata),
+    'technical_documents': ('technical_document', 'id', _document_metadata),
+    'building_codes': ('building_code', 'code_id', _building_code_metadata),
+    'installation_guides': ('installation_guide', 'guide_id', _installation_guide_metadata),
+    'safety_documents': ('safety_document', 'doc_id', _safety_document_metadata),
+    'material_alternatives': ('material_alternative', 'primary_product_id', _material_alternative_metadata),
+    'typical_queries': ('typical_query', 'query', _typical_query_metadata)
+}
+
+def make_text_splitter() -> TextSplitter:
+    return StructuredChunker(chunk_size=1000, chunk_overlap=200)
+
+def prepare_documents(records: List[Tuple[str, Dict[str, Any]]], text_splitter: TextSplitter) -> List[Dict[str, Any]]:
+    """Format, normalize and chunk a batch of (section, record) pairs (the CPU-bound pipeline stage)."""
+    chunked_documents = []
+    for data_type, item in records:
+        if data_type not in PROCESSORS:
+            continue
+        doc_type, id_field, metadata_func = PROCESSORS[data_type]
         try:
-            if isinstance(obj, (dict, list)):
-                return json.dumps(obj, indent=2)
-            return str(obj)
+            content = normalize_text(format_document_content(item, doc_type))
+            metadata = metadata_func(item)
+            metadata['doc_type'] = doc_type
+            document_id = source_document_id(doc_type, item.get(id_field), content)
+            entities, links = record_links(data_type, item)
         except Exception as e:
-            print(f"Warning: JSON serialization error: {str(e)}")
-            return str(obj)
-    
-    def _join_list_safely(self, items: List[str]) -> str:
-        """Safely join list items with proper handling of None and non-string types."""
-        if not items:
-            return ""
-        return ", ".join(str(item) for item in items if item is not None)
+            print(f"Warning: Error processing {data_type} item: {str(e)}")
+            continue
 
-    def format_document_content(self, document: Dict[str, Any], doc_type: str) -> str:
-        """Format document content based on document type with improved error handling."""
+        # Split documents into chunks with proper ID tracking
         try:
-            if doc_type == "product":
-                return f"""Product Information
-                    Name: {document.get('name', 'N/A')}
-                    Category: {document.get('category', 'N/A')}
-                    Manufacturer: {document.get('manufacturer', 'N/A')}
-                    ID: {document.get('id', 'N/A')}
-
-                    Specifications:
-                    {self._sanitize_json(document.get('specifications', {}))}
-
-                    Applications:
-                    {self._join_list_safely(document.get('applications', []))}
-
-                    Technical Details:
-                    {self._sanitize_json(document.get('technical_details', {}))}
-
-                    Price History:
-                    {self._sanitize_json(document.get('price_history', []))}
-
-                    Current Stock:
-                    {self._sanitize_json(document.get('current_stock', {}))}"""
-                    
-            elif doc_type in ["technical_document", "installation_guide", "safety_document"]:
-                return f"""{document.get('title', 'N/A')}
-                    Product ID: {document.get('product_id', 'N/A')}
-
-                    {document.get('content', '').strip()}"""
-                    
-            elif doc_type == "building_code":
-                return f"""{document.get('title', 'N/A')}
-                    Jurisdiction: {document.get('jurisdiction', 'N/A')}
-
-                    {document.get('summary', '').strip()}"""
-                    
-            elif doc_type == "material_alternative":
-                return f"""Material Alternatives for Product ID: {document.get('primary_product_id', 'N/A')}
-                    
-                    Alternatives:
-                    {self._sanitize_json(document.get('alternatives', []))}"""
-                    
-            elif doc_type == "typical_query":
-                return f"""Query: {document.get('query', 'N/A')}
-                    Context: {document.get('context', 'N/A')}
-                    Relevant Products: {self._join_list_safely(document.get('relevant_products', []))}
-                    Relevant Codes: {self._join_list_safely(document.get('relevant_codes', []))}
-                    Relevant Documents: {self._join_list_safely(document.get('relevant_documents', []))}
-                    Considerations: {self._join_list_safely(document.get('considerations', []))}
-                    Key Points: {self._join_list_safely(document.get('key_points', []))}"""
-            
-            return str(document)
-            
+            chunks = text_splitter.split_text(content)
         except Exception as e:
-            print(f"Warning: Error formatting {doc_type} document: {str(e)}")
-            return str(document)
+            print(f"Warning: Error chunking document: {str(e)}")
+            continue
+        for i, chunk in enumerate(chunks):
+            chunked_documents.append({
+                'content': chunk,
+                'metadata': metadata,
+                'id': chunk_id(document_id, i, chunk),  # Stable across rebuilds
+                # For the id index only; not written to the table
+                'entities': entities,
+                'links': links if i == 0 else []
+            })
+    return chunked_documents
+
+class BuildingDataProcessor:
+    """Turns source records into embeddable chunks.
+
+    Records flow through lazy stages: source records are prefetched into a
+    bounded queue, formatted and split in batches (at most `window` batches
+    in flight), and the resulting chunks are consumed by the embedding
+    pipeline as they arrive. Batches are prepared inline by default; the
+    command line opts into a process pool with `workers=None,
+    use_processes=True`. Spawned workers re-import the caller's main module,
+    so a server must not use one.
+    """
+
+    def __init__(self, embeddings: Optional[Embeddings] = None,
+                 workers: Optional[int] = 0,
+                 use_processes: bool = False,
+                 batch_size: int = 64,
+                 window: Optional[int] = None):
+        # Unchanged chunks are served from the shared embedding cache on rebuilds
+        self.embeddings = embeddings or CachedEmbeddings(OpenAIEmbeddings(check_embedding_ctx_length=False))
+        self.text_splitter = make_text_splitter()
+        self.workers = workers
+        self.use_processes = use_processes
+        self.batch_size = batch_size
+        self.window = window
+
+    def format_document_content(self, document: Dict[str, Any], doc_type: str) -> str:
+        return format_document_content(document, doc_type)
+
+    def iter_documents(self, records: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """Lazily format and chunk (section, record) pairs, preserving their order."""
+        workers = os.cpu_count() if self.workers is None else self.workers
+        executor = make_executor(workers, self.use_processes)
+        window = self.window or 2 * max(workers or 1, 1)
+        prepare = partial(prepare_documents, text_splitter=self.text_splitter)
+        try:
+            source = prefetch(batched(records, self.batch_size), maxsize=window)
+            for documents in bounded_map(prepare, source, executor, window):
+                yield from documents
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
 
     def process_data(self, data: Dict[str, Any]) -> list:
         """Process all data into documents for vector storage with improved error handling."""
-        documents = []
-        
-        # Process each document type
-        processors = {
-            'product_catalog': ('product', lambda x: {
-                'product_id': x['id'],
-                'category': x.get('category'),
-                'manufacturer': x.get('manufacturer')
-            }),
-            'technical_documents': ('technical_document', lambda x: {
-                'doc_id': x.get('id'),
-                'product_id': x.get('product_id')
-            }),
-            'building_codes': ('building_code', lambda x: {
-                'code_id': x.get('code_id'),
-                'jurisdiction': x.get('jurisdiction'),
-                'applicable_products': x.get('applicable_products', [])
-            }),
-            'installation_guides': ('installation_guide', lambda x: {
-                'guide_id': x.get('guide_id'),
-                'product_id': x.get('product_id')
-            }),
-            'safety_documents': ('safety_document', lambda x: {
-                'doc_id': x.get('doc_id'),
-                'product_id': x.get('product_id')
-            }),
-            'material_alternatives': ('material_alternative', lambda x: {
-                'product_id': x.get('primary_product_id')
-            }),
-            'typical_queries': ('typical_query', lambda x: {
-                'relevant_products': x.get('relevant_products', []),
-                'relevant_codes': x.get('relevant_codes', []),
-                'relevant_documents': x.get('relevant_documents', [])
-            })
-        }
-        
-        for data_type, (doc_type, metadata_func) in processors.items():
-            for item in data.get(data_type, []):
-                try:
-                    content = self.format_document_content(item, doc_type)
-                    metadata = metadata_func(item)
-                    metadata['doc_type'] = doc_type
-                    
-                    documents.append({
-                        'content': content,
-                        'metadata': metadata,
-                        'id': str(uuid4())  # Add unique ID for each document
-                    })
-                except Exception as e:
-                    print(f"Warning: Error processing {data_type} item: {str(e)}")
-                    continue
-        
-        # Split documents into chunks with proper ID tracking
-        chunked_documents = []
-        for doc in documents:
-            try:
-                chunks = self.text_splitter.split_text(doc['content'])
-                for i, chunk in enumerate(chunks):
-                    chunked_documents.append({
-                        'content': chunk,
-                        'metadata': doc['metadata'],
-                        'id': f"{doc['id']}-chunk-{i}"  # Maintain relationship between chunks
-                    })
-            except Exception as e:
-                print(f"Warning: Error chunking document: {str(e)}")
-                continue
-        
-        return chunked_documents
+        records = (
+            (data_type, item)
+            for data_type in PROCESSORS
+            for item in data.get(data_type, [])
+        )
+        return list(self.iter_documents(records))
+
+
+def iter_source_records(source_path: str = CLEAN_DATA_PATH) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (section, record) pairs from clean_data.json or, streamed, from a raw .txt dump."""
+    if source_path.endswith('.txt'):
+        yield from BuildingDataParser().iter_records(source_path)
+        return
+    with open(source_path, 'r') as file:
+        data = json.load(file)
+    for data_type in PROCESSORS:
+        for item in data.get(data_type, []):
+            yield data_type, item
+
+def open_table_if_exists(db, table_name: str):
+    """Open a table, or return None if it does not exist yet; other errors propagate."""
+    try:
+        return db.open_table(table_name)
+    except ValueError as e:
+        # LanceDB reports a missing table as ValueError("Table '...' was not found")
+        if "not found" not in str(e):
+            raise
+        return None
+
+def read_ids(table) -> List[str]:
+    """The id column alone, without reading vectors, text or metadata."""
+    return table.search().select(['id']).limit(None).to_arrow().column('id').to_pylist()
+
+class _TableWriter:
+    """Append embedded batches to a LanceDB table, creating or replacing it on the first write."""
+
+    def __init__(self, db, table_name: str, overwrite: bool):
+        self.db = db
+        self.table_name = table_name
+        self.overwrite = overwrite
+        self.table = None if overwrite else db.open_table(table_name)
+
+    def write(self, batch: List[Dict[str, Any]], vectors: List[List[float]]):
+        rows = [
+            {'vector': vector, 'id': doc['id'], 'text': doc['content'], 'metadata': doc['metadata']}
+            for doc, vector in zip(batch, vectors)
+        ]
+        # Missing metadata fields become nulls under the shared schema
+        data = pa.Table.from_pylist(rows, schema=table_schema(len(vectors[0])))
+        if self.table is None:
+            self.table = self.db.create_table(self.table_name, data=data, mode="overwrite")
+        else:
+            self.table.add(data)
+
+def build_index(processor: BuildingDataProcessor,
+                source_path: str = CLEAN_DATA_PATH,
+                db_path: str = DB_PATH,
+                table_name: str = TABLE_NAME,
+                incremental: bool = True,
+                pipeline: Optional[EmbeddingPipeline] = None) -> LanceDB:
+    """Embed the source data into a persisted LanceDB table and record its manifest.
+
+    In incremental mode an existing table is diffed against the new chunks:
+    only new or changed chunks are embedded (chunk ids include a content
+    hash), and ids that disappeared are deleted once the new rows are in.
+    Batches are written as they finish, so rerunning an interrupted
+    incremental build resumes where it stopped. `source_path` may also be
+    a raw .txt dump, which is parsed as a stream instead of loaded whole.
+    """
+    fingerprint = source_fingerprint(source_path)
+
+    print("Processing data for vector store...")
+    os.makedirs(db_path, exist_ok=True)
+    db = lancedb.connect(db_path)
+    pipeline = pipeline or EmbeddingPipeline(processor.embeddings)
+    # Chunks are produced lazily from the source, so only ids are held in memory
+    seen_ids = set()
+    id_index = IdIndex()
+
+    def documents() -> Iterator[Dict[str, Any]]:
+        seen_ids.clear()
+        id_index.clear()
+        for doc in processor.iter_documents(iter_source_records(source_path)):
+            seen_ids.add(doc['id'])
+            id_index.add_document(doc)
+            yield doc
+
+    existing_ids = None
+    if incremental:
+        table = open_table_if_exists(db, table_name)
+        if table is not None:
+            existing_ids = set(read_ids(table))
+
+    print("Creating vector store...")
+    if existing_ids is not None:
+        new_docs = (doc for doc in documents() if doc['id'] not in existing_ids)
+        try:
+            report = pipeline.run(new_docs, _TableWriter(db, table_name, overwrite=False).write)
+            stale_ids = [doc_id for doc_id in existing_ids if doc_id not in seen_ids]
+            if stale_ids:
+                quoted_ids = ",".join("'" + doc_id.replace("'", "''") + "'" for doc_id in stale_ids)
+                db.open_table(table_name).delete(f"id IN ({quoted_ids})")
+            print(f"Incremental update: {report['chunks']} added, {len(stale_ids)} deleted, "
+                  f"{len(seen_ids) - report['chunks']} unchanged")
+        except ValueError as e:
+            # e.g. a table written with an older schema; embeddings are cached, so this is cheap
+            print(f"Warning: incremental update failed, rebuilding table: {str(e)}")
+            existing_ids = None
+
+    if existing_ids is None:
+        # Full rebuild: the first finished batch replaces the table
+        pipeline.run(documents(), _TableWriter(db, table_name, overwrite=True).write)
+
+    # Keyword, id and ANN indexes over the same rows: rebuilt after a full build,
+    # otherwise updated with just the rows written above
+    previous = load_manifest(db_path) or {}
+    vector_index, trained_rows = refresh_indexes(db.open_table(table_name),
+                                                 rebuild=existing_ids is None,
+                                                 vector_index=previous.get('vector_index'),
+                                                 trained_rows=previous.get('vector_index_rows'))
+    id_index.save(os.path.join(db_path, ID_INDEX_FILE))
+
+    write_manifest(db_path, {
+        'source_sha256': fingerprint,
+        'table_name': table_name,
+        'embedding_model': getattr(processor.embeddings, 'model', None),
+        'document_format': DOCUMENT_FORMAT,
+        'row_count': len(seen_ids),
+        'vector_index': vector_index,
+        'vector_index_rows': trained_rows,
+        'built_at': int(time.time())
+    })
+
+    print(f"Successfully processed {len(seen_ids)} documents")
+    return LanceDB(
+        connection=db,
+        embedding=processor.embeddings,
+        table_name=table_name,
+        mode="append"
+    )
+
+def build_id_index(source_path: str = CLEAN_DATA_PATH) -> IdIndex:
+    """Rebuild the id index from the source data (formatting and splitting only, no embedding)."""
+    id_index = IdIndex()
+    text_splitter = make_text_splitter()
+    for records in batched(iter_source_records(source_path), 256):
+        for doc in prepare_documents(records, text_splitter):
+            id_index.add_document(doc)
+    return id_index
+
+def restore_index_from_export(export_dir: str = EXPORT_DIR,
+                              db_path: str = DB_PATH,
+                              table_name: str = TABLE_NAME,
+                              source_path: str = CLEAN_DATA_PATH) -> None:
+    """Load a binary vector export into the LanceDB table without embedding anything."""
+    export_manifest = load_export_manifest(export_dir)
+    if export_manifest is None:
+        raise FileNotFoundError(f"No vector export found in {export_dir}")
+
+    os.makedirs(db_path, exist_ok=True)
+    table = import_export(export_dir, lancedb.connect(db_path), table_name)
+    vector_index, trained_rows = refresh_indexes(table)
+    if os.path.exists(source_path):
+        build_id_index(source_path).save(os.path.join(db_path, ID_INDEX_FILE))
+    else:
+        print(f"Warning: {source_path} not found, direct id lookups are disabled")
+
+    write_manifest(db_path, {
+        'source_sha256': export_manifest.get('source_sha256'),
+        'table_name': table_name,
+        'embedding_model': export_manifest.get('embedding_model'),
+        'document_format': export_manifest.get('document_format'),
+        'row_count': export_manifest.get('row_count'),
+        'vector_index': vector_index,
+        'vector_index_rows': trained_rows,
+        'built_at': int(time.time())
+    })
+    print(f"Restored {export_manifest.get('row_count')} rows from {export_dir}")
 
 def main():
     try:
-        # Step 1: import clean_data.json
-        with open('clean_data.json', 'r') as file:
-            data = json.load(file)
-        
-        # Step 2: Process data for vector store
-        print("Processing data for vector store...")
-        processor = BuildingDataProcessor()
-        processed_documents = processor.process_data(data)
+        # Only the command line prepares chunks on a process pool, one worker per core
+        processor = BuildingDataProcessor(workers=None, use_processes=True)
+        vector_store = build_index(processor, incremental="--full" not in sys.argv)
         
-        # Step 3: Create local LanceDB database and connect via LangChain
-        print("Creating vector store...")
-        db = lancedb.connect("./tmp/building_materials_db")
-        
-        # Create the vector store using LangChain's LanceDB integration
-        vector_store = LanceDB.from_texts(
-            texts=[doc['content'] for doc in processed_documents],
-            embedding=processor.embeddings,
-            connection=db,
-            table_name="building_materials",
-            metadatas=[doc['metadata'] for doc in processed_documents]
-        )
-        
-        print(f"Successfully processed {len(processed_documents)} documents")
-        
-        # Export to CSV with proper ID tracking
+        # Export vectors, ids, text and metadata losslessly for other consumers
         tbl = vector_store.get_table()
-        pd_df = tbl.to_pandas()
+        export_table(tbl, EXPORT_DIR, manifest=load_manifest(DB_PATH))
+        print(f"Exported vectors to {EXPORT_DIR}")
+        
+        # Export a human-readable CSV; the vectors only live in the binary export
+        pd_df = tbl.to_pandas().drop(columns=['vector'])
         
         # Ensure all columns are properly serialized
         for col in pd_df.columns:
             if pd_df[col].dtype == 'object':
                 pd_df[col] = pd_df[col].apply(lambda x: str(x) if x is not None else '')
         
-        pd_df.to_csv('building_materials_docs.csv', index=False)
+        pd_df.to_csv(os.path.join(DATA_DIR, 'building_materials_docs.csv'), index=False)
         
         return vector_store
         
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group an iterable into lists of at most `size` items."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def prefetch(items: Iterable[T], maxsize: int = 64) -> Iterator[T]:
+    """Drain `items` on a background thread into a bounded queue.
+
+    The producer blocks once `maxsize` items are waiting, so a slow consumer
+    never lets it run ahead by more than that. Errors are re-raised in the
+    consumer, and closing the generator stops the producer.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def bounded_map(func: Callable[[T], R], items: Iterable[T],
+                executor: Optional[Executor] = None, window: int = 8) -> Iterator[R]:
+    """Apply `func` in `executor` with at most `window` calls in flight, yielding results in order."""
+    if executor is None:
+        yield from map(func, items)
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def make_executor(workers: Optional[int] = None, use_processes: bool = True) -> Optional[Executor]:
+    """Create a worker pool for CPU-bound stages, or None to run them inline.
+
+    `workers=None` uses every core; 0 or 1 runs inline.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    if not workers or workers <= 1:
+        return None
+    if use_processes:
+        # Spawned rather than forked: the prefetch thread may hold locks at fork time
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prepare")
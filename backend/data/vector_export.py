@@ -0,0 +1,105 @@
+import os
+import json
+from typing import Dict, Any, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_FORMAT_VERSION = 1
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "documents.parquet"
+MANIFEST_FILE = "export.json"
+
+class VectorExport:
+    """A binary export of the vector table: float32 vectors plus a Parquet sidecar.
+
+    Row i of `vectors` belongs to row i of `records`. With mmap enabled the
+    vectors are served straight from the page cache without parsing.
+    """
+
+    def __init__(self, vectors: np.ndarray, records: pa.Table, manifest: Dict[str, Any]):
+        if len(vectors) != records.num_rows:
+            raise ValueError(
+                f"Vector count {len(vectors)} does not match record count {records.num_rows}"
+            )
+        self.vectors = vectors
+        self.records = records
+        self.manifest = manifest
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def ids(self) -> list:
+        return self.records.column("id").to_pylist()
+
+    @property
+    def texts(self) -> list:
+        return self.records.column("text").to_pylist()
+
+    def to_arrow(self, vector_key: str = "vector") -> pa.Table:
+        """Rebuild the Arrow table LanceDB expects, without copying the text columns."""
+        dim = self.vectors.shape[1]
+        flat = pa.array(np.ascontiguousarray(self.vectors, dtype=np.float32).reshape(-1))
+        vector_column = pa.FixedSizeListArray.from_arrays(flat, dim)
+        return self.records.add_column(0, vector_key, vector_column)
+
+def export_table(table, export_dir: str, manifest: Optional[Dict[str, Any]] = None,
+                 vector_key: str = "vector") -> str:
+    """Write a LanceDB table to `export_dir` as vectors.npy + documents.parquet + export.json."""
+    os.makedirs(export_dir, exist_ok=True)
+    arrow_table = table.to_arrow()
+
+    vector_column = arrow_table.column(vector_key).combine_chunks()
+    dim = vector_column.type.list_size
+    vectors = vector_column.values.to_numpy(zero_copy_only=False).astype(np.float32, copy=False)
+    vectors = vectors.reshape(len(vector_column), dim)
+
+    # Write to temporary names first so readers never see a half-written export
+    vectors_path = os.path.join(export_dir, VECTORS_FILE)
+    records_path = os.path.join(export_dir, RECORDS_FILE)
+    with open(f"{vectors_path}.tmp", 'wb') as file:
+        np.save(file, vectors)
+    pq.write_table(arrow_table.drop_columns([vector_key]), f"{records_path}.tmp")
+    os.replace(f"{vectors_path}.tmp", vectors_path)
+    os.replace(f"{records_path}.tmp", records_path)
+
+    export_manifest = dict(manifest or {})
+    export_manifest.update({
+        'format_version': EXPORT_FORMAT_VERSION,
+        'row_count': int(vectors.shape[0]),
+        'dimension': int(dim),
+        'dtype': 'float32'
+    })
+    manifest_path = os.path.join(export_dir, MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", 'w') as file:
+        json.dump(export_manifest, file, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    return export_dir
+
+def load_export_manifest(export_dir: str) -> Optional[Dict[str, Any]]:
+    """Read export.json, or return None when there is no usable export."""
+    try:
+        with open(os.path.join(export_dir, MANIFEST_FILE), 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format_version') != EXPORT_FORMAT_VERSION:
+        return None
+    return manifest
+
+def load_export(export_dir: str, mmap: bool = True) -> VectorExport:
+    """Load an export; vectors are memory-mapped read-only unless `mmap` is False."""
+    manifest = load_export_manifest(export_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No vector export found in {export_dir}")
+
+    vectors = np.load(os.path.join(export_dir, VECTORS_FILE), mmap_mode='r' if mmap else None)
+    records = pq.read_table(os.path.join(export_dir, RECORDS_FILE), memory_map=mmap)
+    return VectorExport(vectors, records, manifest)
+
+def import_export(export_dir: str, connection, table_name: str) -> Any:
+    """Create (or overwrite) a LanceDB table from an export without any embedding calls."""
+    export = load_export(export_dir)
+    return connection.create_table(table_name, data=export.to_arrow(), mode="overwrite")
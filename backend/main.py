@@ -1,18 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 from services.chat_service import BuildingMaterialsChatService
+from services.metrics import REGISTRY, TRACE_LOGGER
+import asyncio
+import json
 import time
 # Load environment variables
 load_dotenv()
 
+# Share of request traces logged (failed and slow requests are always logged)
+TRACE_LOGGER.sample_rate = float(os.getenv('BUILDMATE_TRACE_SAMPLE_RATE', '0.1'))
+
 # Initialize BuildingMaterialsChatService with API key
-chat_service = BuildingMaterialsChatService(api_key=os.getenv('OPENAI_API_KEY'))
+chat_service = BuildingMaterialsChatService(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    index_mode=os.getenv('BUILDMATE_INDEX_MODE', 'persisted')
+)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open API connections before the first request; async ones on the server's own event loop
+    clients = chat_service.http_clients
+    warmed = await clients.awarm_up() + await asyncio.to_thread(clients.warm_up)
+    print(f"Warmed up {warmed} API connections (http2={clients.http2})")
+    yield
+    await clients.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -31,6 +51,7 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
+    session_id: str = ""
 
 @app.get("/welcome")
 async def welcome():
@@ -43,15 +64,76 @@ async def welcome():
         "status": "success"
     }
 
+# How often to check whether the client is still waiting for a response
+DISCONNECT_POLL_INTERVAL = 0.5
+
+async def run_until_disconnect(http_request: Request, coro):
+    """Await `coro`, cancelling it if the client disconnects first."""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                print("Client disconnected, cancelled chat request")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+@app.get("/stats")
+async def stats():
+    """Return cache, memory, classifier and connection-reuse counters for tuning."""
+    return {
+        "response_cache": chat_service.response_cache.stats(),
+        "embedding_cache": chat_service.embeddings.stats(),
+        "session_memory": chat_service.memory.stats(),
+        "query_classifier": chat_service.query_classifier.stats(),
+        "http_clients": chat_service.http_clients.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, token counts, cache and error counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     try:
         messages = [msg.dict() for msg in request.messages]
-        return chat_service.get_chat_response(messages)
+        return await run_until_disconnect(
+            http_request,
+            chat_service.aget_chat_response(messages, session_id=request.session_id)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the response as server-sent events.
+
+    Emits a `metadata` event (query type and retrieved doc ids), one `token`
+    event per generated chunk, then `done` with the full message (or `error`).
+    Starlette cancels the generator when the client disconnects.
+    """
+    messages = [msg.dict() for msg in request.messages]
+
+    async def event_stream():
+        async for event in chat_service.astream_chat_response(messages, session_id=request.session_id):
+            event_type = event.pop("event")
+            yield f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,55 +1,173 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder
 )
-from langchain.memory import ConversationBufferMemory
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.documents import Document
 from langchain_community.vectorstores import LanceDB
-from langchain_openai import OpenAIEmbeddings
+import ast
+import asyncio
+import contextvars
+import re
+import threading
 import time
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Any, List, Dict, Optional, Tuple
 from .query_classifier import QueryClassifier, QueryType
+from .embedding_cache import CachedEmbeddings
+from .http_clients import OpenAIHttpClients
+from .local_classifier import TieredQueryClassifier
+from .semantic_cache import CachedResponse, SemanticResponseCache, cache_key
+from .session_memory import SessionMemoryStore
+from .context_builder import ContextBuilder, compact_text
+from .metrics import REGISTRY, STAGE_ERRORS, STAGE_SECONDS, TOKENS, current_trace, span, trace_request
+from .token_counter import count_tokens
+from .retrieval_filters import (
+    DOC_TYPE_FILTERS,
+    IdMatcher,
+    load_product_ids,
+    product_filter,
+    product_record_filter,
+    retrieval_filters
+)
 import pandas as pd
+import pyarrow as pa
+import lancedb
 from lancedb.rerankers import LinearCombinationReranker
 import os
+from data.id_index import ID_INDEX_FILE, IdIndex
+from data.process import (
+    ANN_SEARCH_PARAMS,
+    BuildingDataProcessor,
+    DB_PATH,
+    TABLE_NAME,
+    build_index,
+    ensure_fts_index,
+    index_lock,
+    is_export_current,
+    is_index_current,
+    manifest_version,
+    restore_index_from_export,
+    table_schema
+)
+
+# The CSV export writes list-valued metadata as numpy reprs: array(['IBC-2021-2304'], dtype=object)
+NUMPY_ARRAY_REPR = re.compile(r"array\((\[.*?\])(?:,\s*dtype=\w+)?\)", re.DOTALL)
+
+DEFAULT_STAGE_TIMEOUTS = {
+    "classify": 10.0,
+    "embed": 10.0,
+    "retrieve": 5.0,
+    "generate": 60.0
+}
+# How often requests re-check the manifest for a new index build
+LOOKUPS_CHECK_SECONDS = 1.0
+# Request timeout for re-indexing, whose batches carry up to 256 chunks each
+INGEST_EMBED_TIMEOUT = 600.0
+
+# Retrieval per query type: "vector", "hybrid" (vector + full-text fused by the
+# reranker) or "fts". Keyword-heavy questions benefit most from the text index.
+DEFAULT_SEARCH_MODES = {
+    "safety": "hybrid",
+    "installation": "hybrid",
+    "specifications": "hybrid",
+    "comparison": "vector",
+    "compliance": "hybrid",
+    "commercial": "hybrid",
+    "general": "vector"
+}
+
+class RetrievalResult:
+    """Classification and retrieval output for a query, before generation."""
+
+    def __init__(self, query_type: QueryType, docs: List[Document],
+                 embedding: Optional[List[float]] = None,
+                 cached: Optional[CachedResponse] = None):
+        self.query_type = query_type
+        self.docs = docs
+        self.embedding = embedding
+        self.cached = cached
+
+    @property
+    def doc_ids(self) -> List[str]:
+        if self.cached is not None:
+            return self.cached.doc_ids
+        return [doc.id for doc in self.docs]
 
 class BuildingMaterialsChatService:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, index_mode: str = "persisted",
+                 stage_timeouts: Optional[Dict[str, float]] = None,
+                 search_modes: Optional[Dict[str, str]] = None,
+                 ann_search_params: Optional[Dict[str, int]] = None,
+                 http_clients: Optional[OpenAIHttpClients] = None):
+        # Per-stage timeouts (seconds) for the async pipeline
+        self.stage_timeouts = {**DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {})}
+        
+        # One keep-alive connection pool (sync and async) for the LLM, the classifier and the embeddings
+        self.http_clients = http_clients or OpenAIHttpClients(api_key)
+        
         # Initialize LLM
-        self.llm = ChatOpenAI(
-            api_key=api_key,
+        self.llm = self.http_clients.chat_model(
+            self.stage_timeouts["generate"],
             model="gpt-4o-mini",
             temperature=0.7
         )
+        # Search mode per query type
+        self.search_modes = {**DEFAULT_SEARCH_MODES, **(search_modes or {})}
+        # nprobes / refine_factor, used once the table has an ANN index
+        self.ann_search_params = {**ANN_SEARCH_PARAMS, **(ann_search_params or {})}
         
-        # Initialize classifier
-        self.query_classifier = QueryClassifier(api_key)
+        # Initialize classifier, answering easy queries locally before calling the LLM
+        self.query_classifier = TieredQueryClassifier(QueryClassifier(
+            api_key,
+            self.http_clients.chat_model(self.stage_timeouts["classify"], model="gpt-4o-mini", temperature=0)
+        ))
         
         # Initialize embeddings and vector store
-        self.embeddings = OpenAIEmbeddings(api_key=api_key)
-        reranker = LinearCombinationReranker(weight=0.3)
+        # Chunks and queries are far below the model's context limit, so texts are sent
+        # as-is instead of being tokenized client-side with tiktoken first
+        self.embeddings = CachedEmbeddings(
+            self.http_clients.embeddings(self.stage_timeouts["embed"], check_embedding_ctx_length=False)
+        )
+        # Re-indexing embeds large batches, so it gets its own long timeout (same model and disk cache).
+        # Its chunks are embedded once per build, so they are not kept in memory.
+        self.ingest_embeddings = CachedEmbeddings(
+            self.http_clients.embeddings(INGEST_EMBED_TIMEOUT, check_embedding_ctx_length=False),
+            max_memory_bytes=0
+        )
+        # Fuses vector and full-text scores in hybrid search
+        self.reranker = LinearCombinationReranker(weight=0.3)
         
         # Set up vector store with data
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(os.path.dirname(current_dir))
-        csv_path = os.path.join(parent_dir, "backend", "data", "building_materials_docs.csv")
-        
-        df = pd.read_csv(csv_path)
-        texts = df['text'].tolist()
-
-        self.vectorstore = LanceDB.from_texts(
-            texts=texts,
-            embedding=self.embeddings,
-            reranker=reranker
-        )
+        start_time = time.time()
+        if index_mode == "persisted":
+            self.vectorstore = self._open_persisted_store(self.reranker)
+        elif index_mode == "csv":
+            self.vectorstore = self._build_store_from_csv(self.reranker)
+        else:
+            raise ValueError(f"Unknown index mode: {index_mode}")
+        print(f"Vector store ready ({index_mode}) in {(time.time() - start_time) * 1000:.1f} ms")
         self.retriever = self.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+        # Runs query embedding speculatively alongside classification in the sync path
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        # Product ids and the id index of the current build, reloaded whenever the index is rebuilt
+        self._product_matcher: Optional[IdMatcher] = None
+        self._id_index: Optional[IdIndex] = None
+        self._id_matcher: Optional[IdMatcher] = None
+        self._lookups_version: Optional[str] = None
+        self._lookups_checked = float("-inf")
+        self._lookups_lock = threading.Lock()
+        self._refresh_lookups()
         
-        # Initialize memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # Initialize per-session memory
+        self.memory = SessionMemoryStore(model=self.llm.model_name)
+        
+        # First-turn responses, reused for semantically equivalent queries
+        self.response_cache = SemanticResponseCache()
+        
+        # Cache and memory counters are read from their owners on each /metrics scrape
+        REGISTRY.register_collector(self._collect_metrics)
+        REGISTRY.register_collector(self.http_clients.collect_metrics)
         
         # System context
         self.system_context = """You are BuildMate, an expert building materials assistant. Your purpose is to help contractors and builders make informed decisions about construction materials and projects.
@@ -69,6 +187,75 @@ class BuildingMaterialsChatService:
         - Not use symbols like #, *, etc.
         - Not use markdown formatting like bold, italics, etc."""
         
+        # Prompt chains compiled once per query type; retrieved docs fill them within a token budget
+        self.context_builder = ContextBuilder(self.llm.model_name)
+        self.chains = self._compile_chains()
+
+    def _open_persisted_store(self, reranker: LinearCombinationReranker) -> LanceDB:
+        """Open the on-disk LanceDB table, re-indexing only if clean_data.json changed.
+
+        Lance files are read through the OS page cache, so every worker opening
+        the same table shares one copy of the data instead of re-embedding it.
+        """
+        embedding_model = getattr(self.embeddings, "model", None)
+        with index_lock(DB_PATH):
+            if not is_index_current(embedding_model=embedding_model):
+                if is_export_current(embedding_model=embedding_model):
+                    print("Persisted index is missing or stale, restoring from vector export...")
+                    restore_index_from_export()
+                else:
+                    print("Persisted index is missing or stale, re-indexing...")
+                    # Inline: spawned workers would re-import the server's main module and block on index_lock
+                    build_index(BuildingDataProcessor(self.ingest_embeddings, workers=0))
+        
+        db = lancedb.connect(DB_PATH)
+        return LanceDB(
+            connection=db,
+            embedding=self.embeddings,
+            table_name=TABLE_NAME,
+            reranker=reranker,
+            mode="append"
+        )
+
+    @staticmethod
+    def _parse_csv_metadata(value) -> Dict:
+        """Metadata is exported to the CSV as a Python dict repr, with numpy arrays for lists."""
+        try:
+            if not isinstance(value, str) or not value:
+                return {}
+            metadata = ast.literal_eval(NUMPY_ARRAY_REPR.sub(r"\1", value))
+            return metadata if isinstance(metadata, dict) else {}
+        except (ValueError, SyntaxError) as e:
+            print(f"Warning: could not parse CSV metadata, filters will skip this row: {str(e)}")
+            return {}
+
+    def _build_store_from_csv(self, reranker: LinearCombinationReranker) -> LanceDB:
+        """Embed the exported CSV into a fresh in-process table (legacy mode)."""
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        parent_dir = os.path.dirname(os.path.dirname(current_dir))
+        csv_path = os.path.join(parent_dir, "backend", "data", "building_materials_docs.csv")
+        
+        df = pd.read_csv(csv_path)
+        texts = df['text'].tolist()
+        # Keep ids and metadata so metadata filters work in this mode too
+        ids = df['id'].astype(str).tolist() if 'id' in df else [str(i) for i in range(len(texts))]
+        metadatas = [self._parse_csv_metadata(m) for m in df['metadata']] if 'metadata' in df else [{}] * len(texts)
+        vectors = self.ingest_embeddings.embed_documents(texts)
+        
+        rows = [
+            {'vector': vector, 'id': doc_id, 'text': text, 'metadata': metadata}
+            for vector, doc_id, text, metadata in zip(vectors, ids, texts, metadatas)
+        ]
+        db = lancedb.connect("/tmp/lancedb")
+        table = db.create_table(TABLE_NAME, data=pa.Table.from_pylist(rows, schema=table_schema(len(vectors[0]))), mode="overwrite")
+        ensure_fts_index(table)
+        return LanceDB(
+            connection=db,
+            embedding=self.embeddings,
+            table_name=TABLE_NAME,
+            reranker=reranker,
+            mode="append"
+        )
 
     def _identify_query_type(self, query: str) -> QueryType:
         """Identify query type using QueryClassifier."""
@@ -144,104 +331,473 @@ class BuildingMaterialsChatService:
         }
         return base_contexts.get(query_type.primary_type, base_contexts["general"])
 
-    def _get_relevant_docs(self, query: str) -> str:
-        """Retrieve relevant documents using RAG."""
-        docs = self.retriever.invoke(query)
-        return "\n\n".join(doc.page_content for doc in docs)
+    async def _aidentify_query_type(self, query: str) -> QueryType:
+        """Identify query type without blocking the event loop."""
+        with span("classify"):
+            return await self.query_classifier.aclassify_query(query, timeout=self.stage_timeouts["classify"])
 
-    def _format_query(self, query: str, context: str, retrieved_docs: str) -> str:
-        """Format the query with all necessary context."""
-        return f"""Query/user prompt: {query}
-        
-        Some context might be useful:
-        {context}
-        
-        Some infomation might be useful from Retrieved Documentation:
-        {retrieved_docs}"""
+    def _lookups_due(self) -> bool:
+        return time.monotonic() - self._lookups_checked >= LOOKUPS_CHECK_SECONDS
 
-    def get_chat_response(self, messages: List[Dict]) -> Dict:
-        """Process query and generate response using RAG and LLM."""
+    def _refresh_lookups(self):
+        """Reload the product ids and id index if the index was rebuilt.
+
+        Called once per request, before the lookups are used; the manifest
+        is checked at most once per LOOKUPS_CHECK_SECONDS.
+        """
+        if not self._lookups_due():
+            return
+        with self._lookups_lock:
+            if not self._lookups_due():
+                return
+            version = manifest_version(DB_PATH)
+            if self._product_matcher is None or version != self._lookups_version:
+                try:
+                    product_ids = load_product_ids(self.vectorstore.get_table())
+                except Exception as e:
+                    print(f"Warning: could not load product ids for filtering: {str(e)}")
+                    product_ids = []
+                self._product_matcher = IdMatcher(product_ids)
+                self._id_index = IdIndex.load(os.path.join(DB_PATH, ID_INDEX_FILE))
+                self._id_matcher = IdMatcher(self._id_index.ids)
+                self._lookups_version = version
+            self._lookups_checked = time.monotonic()
+
+    async def _arefresh_lookups(self):
+        """Refresh the lookups in a worker thread: the stat and a reload's table scan stay off the event loop."""
+        if self._lookups_due():
+            await asyncio.to_thread(self._refresh_lookups)
+
+    def _get_product_matcher(self) -> IdMatcher:
+        """Matcher over the product ids in the current index build."""
+        return self._product_matcher
+
+    def _find_linked_ids(self, query: str) -> List[str]:
+        """Product, code, document and guide ids named in the query that the id index knows."""
+        return self._id_matcher.find(query)
+
+    def _get_search_filters(self, query: str, query_type: QueryType) -> List[Optional[str]]:
+        """Metadata pre-filters for the query, from most to least specific."""
+        product_ids = self._get_product_matcher().find(query)
+        return retrieval_filters(query_type.primary_type, product_ids)
+
+    def _run_search(self, table, mode: str, query: Optional[str],
+                    embedding: Optional[List[float]], where: Optional[str], k: int) -> List[Dict]:
+        """One LanceDB query in the given mode, falling back to vector search without a text index."""
+        hybrid = mode == "hybrid" and query and embedding is not None
         try:
-            # Get the latest message
-            latest_message = messages[-1]
-            query = latest_message["content"]
-            
-            print(f"Received query: {query}")
-            
-            # 1. Classify the query
-            query_type = self._identify_query_type(query)
-            print(f"Query type: {query_type}")
-            
-            # Handle non-building material queries differently
-            if query_type.primary_type == "other":
-                context = ""
-                retrieved_docs = ""
+            if mode == "fts":
+                search = table.search(query, query_type="fts")
+            elif hybrid:
+                search = table.search(query_type="hybrid").vector(embedding).text(query)
             else:
-                # 2. Get the context based on classification
-                context = self._get_query_context(query_type)
-                # Escape any curly braces in the context
-                context = context.replace("{", "{{").replace("}", "}}")
-                
-                # 3. Retrieve relevant documents
-                retrieved_docs = self._get_relevant_docs(query)
-                # Escape any curly braces in the retrieved docs
-                retrieved_docs = retrieved_docs.replace("{", "{{").replace("}", "}}")
-            
-            # Create dynamic system context with the current context and docs
-            # Escape any curly braces in the system context
-            escaped_system_context = self.system_context.replace("{", "{{").replace("}", "}}")
-            
-            dynamic_system_context = escaped_system_context + "\n\n"
-            if context:
-                dynamic_system_context += f"Some context might be useful:\n{context}\n\n"
-            if retrieved_docs:
-                dynamic_system_context += f"Some information might be useful from Retrieved Documentation:\n{retrieved_docs}"
-            
-            print("Creating prompt template...")
-            
-            # Create a new prompt template with the dynamic system context
+                search = table.search(embedding)
+            if where:
+                search = search.where(where, prefilter=True)
+            if mode != "fts":
+                search = search.nprobes(self.ann_search_params["nprobes"])
+                if self.ann_search_params.get("refine_factor"):
+                    search = search.refine_factor(self.ann_search_params["refine_factor"])
+            if hybrid:
+                search = search.rerank(self.reranker)
+            return search.limit(k).to_list()
+        except Exception as e:
+            if mode == "vector" or embedding is None:
+                raise
+            STAGE_ERRORS.inc(stage=f"{mode}_search", error=type(e).__name__)
+            print(f"Warning: {mode} search failed, using vector search: {str(e)}")
+            return self._run_search(table, "vector", query, embedding, where, k)
+
+    def _search(self, embedding: Optional[List[float]], k: int,
+                filters: Optional[List[Optional[str]]] = None,
+                query: Optional[str] = None, mode: str = "vector") -> List[Document]:
+        """Run a search, keeping each row's id on the returned Document.
+
+        Filters are applied as LanceDB pre-filters, most specific first. The
+        first filter that matches any rows answers the query, even with fewer
+        than `k`; broader filters, and finally the unfiltered search, only
+        run when the narrower ones match nothing.
+        """
+        table = self.vectorstore.get_table()
+        for where in filters or [None]:
+            rows = self._run_search(table, mode, query, embedding, where, k)
+            if rows:
+                break
+        return [
+            Document(id=row["id"], page_content=row["text"], metadata=row.get("metadata") or {})
+            for row in rows
+        ]
+
+    def _fetch_chunks(self, chunk_ids: List[str]) -> List[Document]:
+        """Load chunks by id (a scalar-index lookup), in the given order."""
+        if not chunk_ids:
+            return []
+        quoted_ids = ",".join("'" + chunk_id.replace("'", "''") + "'" for chunk_id in chunk_ids)
+        rows = (
+            self.vectorstore.get_table().search()
+            .where(f"id IN ({quoted_ids})")
+            .select(["id", "text", "metadata"])
+            .limit(len(chunk_ids))
+            .to_list()
+        )
+        by_id = {row["id"]: row for row in rows}
+        return [
+            Document(id=chunk_id, page_content=by_id[chunk_id]["text"], metadata=by_id[chunk_id].get("metadata") or {})
+            for chunk_id in chunk_ids if chunk_id in by_id
+        ]
+
+    def _get_linked_docs(self, ids: List[str], query_type: Optional[QueryType] = None) -> List[Document]:
+        """The chunks of the named ids plus those linked to them, e.g. a product's safety docs and codes."""
+        preferred = DOC_TYPE_FILTERS.get(query_type.primary_type) if query_type is not None else None
+        return self._fetch_chunks(self._id_index.bundle(ids, doc_types_first=preferred))
+
+    def _needs_embedding(self, query: str) -> bool:
+        """False when the query names ids that the id or keyword index resolve directly."""
+        return not (self._find_linked_ids(query) or self._lookup_product_ids(query))
+
+    def _get_relevant_docs(self, query: str, query_type: Optional[QueryType] = None,
+                           embedding: Optional[List[float]] = None) -> List[Document]:
+        """Retrieve relevant documents using RAG.
+
+        Ids named in the query are resolved through the id index to their
+        linked bundle, and SKU-only queries through the keyword index;
+        everything else goes through vector or hybrid search.
+        """
+        linked_ids = self._find_linked_ids(query)
+        if linked_ids:
+            docs = self._get_linked_docs(linked_ids, query_type)
+            if docs:
+                return docs
+        product_ids = self._lookup_product_ids(query)
+        if product_ids:
+            return self._get_product_docs(query, product_ids)
+
+        mode = self.search_modes.get(query_type.primary_type, "vector") if query_type is not None else "vector"
+        if embedding is None and mode != "fts":
+            embedding = self._embed_query(query)
+        filters = self._get_search_filters(query, query_type) if query_type is not None else None
+        return self._search(embedding, self.retriever.search_kwargs["k"], filters, query, mode)
+
+    def _lookup_product_ids(self, query: str) -> List[str]:
+        """Product ids when the query is an exact SKU lookup."""
+        return self._get_product_matcher().lookup_ids(query)
+
+    def _get_product_docs(self, query: str, product_ids: List[str]) -> List[Document]:
+        """Resolve a SKU lookup from the full-text index without embedding the query."""
+        # Catalog entries first, then everything else about the products
+        filters = [product_record_filter(product_ids), product_filter(product_ids), None]
+        return self._search(None, self.retriever.search_kwargs["k"], filters, query, mode="fts")
+
+    def _embed_query(self, query: str) -> List[float]:
+        with span("embed"):
+            return self.embeddings.embed_query(query)
+
+    async def _aembed_query(self, query: str) -> Optional[List[float]]:
+        """Embed the query without blocking, or return None if it times out."""
+        try:
+            with span("embed"):
+                return await asyncio.wait_for(
+                    self.embeddings.aembed_query(query),
+                    timeout=self.stage_timeouts["embed"]
+                )
+        except asyncio.TimeoutError:
+            return None
+
+    async def _asearch(self, query: str, query_type: QueryType, embedding: Optional[List[float]]) -> List[Document]:
+        """Run the local LanceDB search in a worker thread, bounded by the retrieve timeout."""
+        try:
+            with span("retrieve"):
+                return await asyncio.wait_for(
+                    asyncio.to_thread(self._get_relevant_docs, query, query_type, embedding),
+                    timeout=self.stage_timeouts["retrieve"]
+                )
+        except asyncio.TimeoutError:
+            return []
+
+    async def _aclassify_and_retrieve(self, query: str, cacheable: bool = False) -> RetrievalResult:
+        """Classify the query while embedding it, then search the index.
+
+        When `cacheable` is set, a semantically equivalent cached response
+        short-circuits the pipeline. The search itself waits for the
+        classification, whose query type picks the metadata pre-filters; it
+        is skipped if the query is not about building materials. If
+        embedding or search time out the answer is generated without
+        retrieved docs. Queries naming known ids are resolved through the id
+        and keyword indexes instead, without embedding them.
+        """
+        classification = asyncio.create_task(self._aidentify_query_type(query))
+        try:
+            await self._arefresh_lookups()
+        except BaseException:
+            classification.cancel()
+            raise
+        if not self._needs_embedding(query):
+            # Id lookups skip the embedding (and with it the semantic cache)
+            query_type = await classification
+            if query_type.primary_type == "other":
+                return RetrievalResult(query_type, [])
+            return RetrievalResult(query_type, await self._asearch(query, query_type, None))
+        try:
+            embedding = await self._aembed_query(query)
+            if cacheable and embedding is not None:
+                with span("cache_lookup"):
+                    cached = self.response_cache.lookup(embedding, self._lookups_version, self._cache_key(query))
+                if cached is not None:
+                    classification.cancel()
+                    return RetrievalResult(cached.query_type, [], embedding, cached)
+            query_type = await classification
+        except BaseException:
+            classification.cancel()
+            raise
+        if embedding is None or query_type.primary_type == "other":
+            return RetrievalResult(query_type, [], embedding)
+        return RetrievalResult(query_type, await self._asearch(query, query_type, embedding), embedding)
+
+    def _cache_key(self, query: str) -> str:
+        ids = self._find_linked_ids(query) + self._get_product_matcher().find(query)
+        return cache_key(query, ids)
+
+    def _cache_response(self, query: str, result: RetrievalResult, response: str):
+        """Remember a first-turn response for semantically equivalent future queries.
+
+        Answers generated without retrieved docs (off-topic queries, or a
+        retrieval that timed out or found nothing) are not cached.
+        """
+        if result.embedding is None or result.cached is not None or not result.docs:
+            return
+        self.response_cache.store(
+            result.embedding,
+            CachedResponse(query, result.query_type, result.doc_ids, response),
+            self._lookups_version,
+            self._cache_key(query)
+        )
+
+    @staticmethod
+    def _is_first_turn(messages: List[Dict]) -> bool:
+        """True when the user has not asked anything before the latest message."""
+        return not any(message.get("role") == "user" for message in messages[:-1])
+
+    def _compile_chains(self) -> Dict[str, Any]:
+        """Build the prompt | llm | parser chain for every query type.
+
+        The static system text is compacted and brace-escaped here, once;
+        the query and retrieved documentation are passed as template variables.
+        """
+        def escape(text: str) -> str:
+            return compact_text(text).replace("{", "{{").replace("}", "}}")
+
+        system_context = escape(self.system_context) + "\n\n"
+        query_types = list(DEFAULT_SEARCH_MODES) + ["other"]
+        chains = {}
+        for primary_type in query_types:
+            system = system_context
+            if primary_type != "other":
+                context = self._get_query_context(QueryType(primary_type=primary_type))
+                system += f"Some context might be useful:\n{escape(context)}\n\n"
             prompt = ChatPromptTemplate.from_messages([
-                ("system", dynamic_system_context),
+                ("system", system + "{documentation}"),
                 MessagesPlaceholder(variable_name="chat_history"),
-                ("human", query)
+                ("human", "{query}")
             ])
-            
-            print("Getting chat history...")
-            chat_history = self.memory.load_memory_variables({})["chat_history"]
-            
-            print("Generating response...")
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({
-                "chat_history": chat_history
-            })
-            
-            print(f"Generated response: {response}")
-            
-            # Save to memory and return response
-            self.memory.save_context(
-                {"input": query},
-                {"output": response}
-            )
-            
-            return {
-                "id": str(time.time()),
-                "role": "assistant",
-                "content": response,
-                "createTime": int(time.time() * 1000),
-                "status": "success",
-                "query_type": query_type.dict()
-            }
-            
-        except Exception as e:
-            print(f"Error in chat response: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            return {
-                "id": str(time.time()),
-                "role": "assistant",
-                "content": "I apologize, but I encountered an error processing your request. Could you please rephrase your question?",
-                "createTime": int(time.time() * 1000),
-                "status": "error",
-                "error": str(e)
-            }
\ No newline at end of file
+            chains[primary_type] = prompt | self.llm | StrOutputParser()
+        return chains
+
+    def _build_prompt(self, query: str, query_type: QueryType, docs: List[Document],
+                      chat_history: List, history_tokens: int) -> Tuple[Any, Dict[str, Any]]:
+        """Pick the compiled chain for a classified query and fill in its variables.
+
+        Token metrics reuse the counts the context builder and session memory
+        already made; only the query is counted here.
+        """
+        chain = self.chains.get(query_type.primary_type, self.chains["general"])
+        documentation, context_tokens = "", 0
+        if query_type.primary_type != "other" and docs:
+            context, context_tokens = self.context_builder.build(docs)
+            documentation = "Some information might be useful from Retrieved Documentation:\n" + context
+        TOKENS.inc(count_tokens(query, self.llm.model_name), kind="query")
+        TOKENS.inc(context_tokens, kind="context")
+        TOKENS.inc(history_tokens, kind="history")
+        return chain, {"chat_history": chat_history, "query": query, "documentation": documentation}
+
+    def _record_response(self, response: str, query_type: QueryType, docs: List[Document], cached: bool = False):
+        """Count completion tokens and annotate the current trace."""
+        if not cached:
+            TOKENS.inc(count_tokens(response, self.llm.model_name), kind="completion")
+        trace = current_trace()
+        if trace is not None:
+            trace.set(query_type=query_type.primary_type, docs=len(docs), cached=cached, response_chars=len(response))
+
+    def _collect_metrics(self):
+        """Samples for /metrics from the caches, classifier and session memory."""
+        response_cache = self.response_cache.stats()
+        embedding_cache = self.embeddings.stats()
+        memory = self.memory.stats()
+        classifier = self.query_classifier.stats()
+        lookups = "buildmate_cache_lookups_total"
+        lookups_help = "Cache lookups by cache and result."
+        yield lookups, "counter", lookups_help, {"cache": "response", "result": "hit"}, response_cache["hits"]
+        yield lookups, "counter", lookups_help, {"cache": "response", "result": "miss"}, response_cache["misses"]
+        yield lookups, "counter", lookups_help, {"cache": "embedding", "result": "memory_hit"}, embedding_cache["memory_hits"]
+        yield lookups, "counter", lookups_help, {"cache": "embedding", "result": "disk_hit"}, embedding_cache["disk_hits"]
+        yield lookups, "counter", lookups_help, {"cache": "embedding", "result": "miss"}, embedding_cache["misses"]
+        for tier in self.query_classifier.TIERS:
+            yield ("buildmate_classifications_total", "counter", "Queries classified, by the tier that answered.",
+                   {"tier": tier}, classifier[f"{tier}_hits"])
+        entries = "buildmate_cache_entries"
+        yield entries, "gauge", "Entries held by each cache.", {"cache": "response"}, response_cache["entries"]
+        yield entries, "gauge", "Entries held by each cache.", {"cache": "embedding"}, embedding_cache["memory_entries"]
+        yield "buildmate_memory_sessions", "gauge", "Chat sessions held in memory.", {}, memory["sessions"]
+        yield "buildmate_memory_tokens", "gauge", "Tokens of chat history held in memory.", {}, memory["total_tokens"]
+        yield "buildmate_memory_evictions_total", "counter", "Sessions evicted from memory.", {}, memory["evictions"]
+
+    def _build_response(self, response: str, query_type: QueryType) -> Dict:
+        """Wrap a generated answer in the message format the frontend expects."""
+        return {
+            "id": str(time.time()),
+            "role": "assistant",
+            "content": response,
+            "createTime": int(time.time() * 1000),
+            "status": "success",
+            "query_type": query_type.dict()
+        }
+
+    def _build_error_response(self, e: Exception) -> Dict:
+        """Log an error and return the apology message sent to the user."""
+        trace = current_trace()
+        if trace is not None:
+            trace.status = "error"
+            trace.set(error=f"{type(e).__name__}: {str(e)}")
+        print(f"Error in chat response: {str(e)}")
+        print(f"Error type: {type(e)}")
+        import traceback
+        print(f"Traceback: {traceback.format_exc()}")
+        return {
+            "id": str(time.time()),
+            "role": "assistant",
+            "content": "I apologize, but I encountered an error processing your request. Could you please rephrase your question?",
+            "createTime": int(time.time() * 1000),
+            "status": "error",
+            "error": str(e)
+        }
+
+    def get_chat_response(self, messages: List[Dict], session_id: Optional[str] = None) -> Dict:
+        """Process query and generate response using RAG and LLM."""
+        with trace_request("chat_sync"):
+            try:
+                query = messages[-1]["content"]
+                
+                # 1. Start embedding speculatively, unless the query names ids the indexes resolve
+                self._refresh_lookups()
+                embedding = None
+                if self._needs_embedding(query):
+                    # Run in a copy of this context so the embed span joins the request's trace
+                    embedding = self._retrieval_executor.submit(
+                        contextvars.copy_context().run, self._embed_query, query)
+                
+                # 2. Classify the query while the embedding runs
+                with span("classify"):
+                    query_type = self._identify_query_type(query)
+                
+                # 3. Search with the query type's filters, for building material queries only
+                docs = []
+                if query_type.primary_type == "other":
+                    if embedding is not None:
+                        embedding.cancel()
+                else:
+                    query_embedding = embedding.result() if embedding else None
+                    with span("retrieve"):
+                        docs = self._get_relevant_docs(query, query_type, query_embedding)
+                
+                with span("prompt"):
+                    chat_history, history_tokens = self.memory.get_history_with_tokens(session_id, messages[:-1])
+                    chain, inputs = self._build_prompt(query, query_type, docs, chat_history, history_tokens)
+                with span("generate"):
+                    response = chain.invoke(inputs)
+                
+                # Save to memory and return response
+                self.memory.save_turn(session_id, query, response)
+                self._record_response(response, query_type, docs)
+                return self._build_response(response, query_type)
+                
+            except Exception as e:
+                return self._build_error_response(e)
+
+    async def aget_chat_response(self, messages: List[Dict], session_id: Optional[str] = None) -> Dict:
+        """Async version of get_chat_response with per-stage timeouts.
+
+        Cancelling the returned coroutine (e.g. when the client disconnects)
+        aborts the in-flight OpenAI call and skips saving the turn to memory.
+        """
+        with trace_request("chat"):
+            try:
+                query = messages[-1]["content"]
+                
+                cacheable = self._is_first_turn(messages)
+                result = await self._aclassify_and_retrieve(query, cacheable=cacheable)
+                if result.cached is not None:
+                    response = result.cached.response
+                else:
+                    with span("prompt"):
+                        chat_history, history_tokens = self.memory.get_history_with_tokens(session_id, messages[:-1])
+                        chain, inputs = self._build_prompt(query, result.query_type, result.docs, chat_history, history_tokens)
+                    
+                    with span("generate"):
+                        response = await asyncio.wait_for(
+                            chain.ainvoke(inputs),
+                            timeout=self.stage_timeouts["generate"]
+                        )
+                    if cacheable:
+                        self._cache_response(query, result, response)
+                
+                self.memory.save_turn(session_id, query, response)
+                self._record_response(response, result.query_type, result.docs, cached=result.cached is not None)
+                return self._build_response(response, result.query_type)
+                
+            except Exception as e:
+                return self._build_error_response(e)
+
+    async def astream_chat_response(self, messages: List[Dict],
+                                    session_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Stream a response as events: metadata first, then tokens, then the full message.
+
+        The assembled response is saved to memory only once the stream completes.
+        """
+        with trace_request("chat_stream"):
+            try:
+                query = messages[-1]["content"]
+                
+                cacheable = self._is_first_turn(messages)
+                result = await self._aclassify_and_retrieve(query, cacheable=cacheable)
+                yield {
+                    "event": "metadata",
+                    "query_type": result.query_type.dict(),
+                    "doc_ids": result.doc_ids,
+                    "cached": result.cached is not None
+                }
+                
+                if result.cached is not None:
+                    response = result.cached.response
+                    yield {"event": "token", "content": response}
+                else:
+                    with span("prompt"):
+                        chat_history, history_tokens = self.memory.get_history_with_tokens(session_id, messages[:-1])
+                        chain, inputs = self._build_prompt(query, result.query_type, result.docs, chat_history, history_tokens)
+                    
+                    parts = []
+                    with span("generate"):
+                        start = time.perf_counter()
+                        async for token in chain.astream(inputs):
+                            if not parts:
+                                STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_token")
+                            parts.append(token)
+                            yield {"event": "token", "content": token}
+                    response = "".join(parts)
+                    if cacheable:
+                        self._cache_response(query, result, response)
+                
+                self.memory.save_turn(session_id, query, response)
+                self._record_response(response, result.query_type, result.docs, cached=result.cached is not None)
+                yield {"event": "done", **self._build_response(response, result.query_type)}
+                
+            except Exception as e:
+                yield {"event": "error", **self._build_error_response(e)}
@@ -0,0 +1,112 @@
+from typing import Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from .token_counter import DEFAULT_MODEL, count_tokens
+
+# Tokens of retrieved documentation allowed per request, by chat model
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o-mini": 1500,
+    "gpt-4o": 1500
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1200
+
+# The splitter overlaps neighbouring chunks by up to this many characters
+MAX_CHUNK_OVERLAP = 200
+
+def compact_text(text: str) -> str:
+    """Strip per-line indentation and trailing space, and collapse runs of blank lines."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    compacted = []
+    for line in lines:
+        if line or (compacted and compacted[-1]):
+            compacted.append(line)
+    return "\n".join(compacted).strip()
+
+def _chunk_position(doc: Document) -> Tuple[Optional[str], int]:
+    """(source document id, chunk index) from a `doc_type:source_id:index:hash` chunk id."""
+    parts = (doc.id or "").rsplit(":", 2)
+    if len(parts) == 3 and parts[1].isdigit():
+        return parts[0], int(parts[1])
+    return None, 0
+
+def _merge_overlap(first: str, second: str, max_overlap: int = MAX_CHUNK_OVERLAP) -> str:
+    """Join consecutive chunks, dropping the lines the second repeats from the end of the first.
+
+    The splitter overlaps on whole lines, but strips the indentation of a
+    chunk's first line, so lines are compared without surrounding whitespace.
+    The header line the structured chunker repeats on every chunk is dropped too.
+    """
+    first_lines = [line.strip() for line in first.splitlines()]
+    second_lines = [line.strip() for line in second.splitlines()]
+    if first_lines and second_lines and second_lines[0] == first_lines[0]:
+        second_lines = second_lines[1:]
+    best = 0
+    for size in range(1, min(len(first_lines), len(second_lines)) + 1):
+        if sum(len(line) + 1 for line in second_lines[:size]) > max_overlap + 1:
+            break
+        if first_lines[-size:] == second_lines[:size]:
+            best = size
+    return "\n".join(first_lines + second_lines[best:])
+
+class ContextBuilder:
+    """Assembles retrieved chunks into a documentation block within a token budget.
+
+    Chunks of the same source document are merged in order with their
+    splitter overlap removed, exact duplicates are dropped, indentation
+    padding is stripped, and documents are added in retrieval order until
+    the budget is spent (the last one is cut at a line boundary).
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, max_tokens: Optional[int] = None):
+        self.model = model
+        self.max_tokens = max_tokens or CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+    def merge_chunks(self, docs: List[Document]) -> List[str]:
+        """One compacted text per source document, ordered by its best-ranked chunk."""
+        groups: Dict[str, List[Tuple[int, str]]] = {}
+        for position, doc in enumerate(docs):
+            source_id, index = _chunk_position(doc)
+            key = source_id or f"#{position}"
+            if all(text != doc.page_content for _, text in groups.get(key, [])):
+                groups.setdefault(key, []).append((index, doc.page_content))
+
+        texts, seen = [], set()
+        for chunks in groups.values():
+            chunks.sort()
+            merged = chunks[0][1]
+            for (previous_index, _), (index, text) in zip(chunks, chunks[1:]):
+                if index == previous_index + 1:
+                    merged = _merge_overlap(merged, text)
+                else:
+                    merged = merged + "\n" + text
+            text = compact_text(merged)
+            if text and text not in seen:
+                seen.add(text)
+                texts.append(text)
+        return texts
+
+    def _truncate(self, text: str, budget: int) -> Tuple[str, int]:
+        kept, used = [], 0
+        for line in text.splitlines():
+            tokens = count_tokens(line + "\n", self.model)
+            if used + tokens > budget:
+                break
+            kept.append(line)
+            used += tokens
+        return "\n".join(kept), used
+
+    def build(self, docs: List[Document]) -> Tuple[str, int]:
+        """The documentation block for the prompt ("" when there is nothing to add) and its tokens."""
+        sections, used = [], 0
+        for text in self.merge_chunks(docs):
+            # The blank line between sections costs a token too
+            separator = 1 if sections else 0
+            tokens = count_tokens(text, self.model)
+            if used + separator + tokens > self.max_tokens:
+                text, tokens = self._truncate(text, self.max_tokens - used - separator)
+                if text:
+                    sections.append(text)
+                    used += separator + tokens
+                break
+            sections.append(text)
+            used += separator + tokens
+        return "\n\n".join(sections), used
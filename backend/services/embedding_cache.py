@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.getenv("BUILDMATE_EMBEDDING_CACHE", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tmp", "embedding_cache.sqlite3"
+))
+# Float32 vectors held in memory: 64 MB is ~10k text-embedding-3-small vectors
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+# Rows kept on disk; the least recently used are pruned past this
+DEFAULT_MAX_DISK_ROWS = 200_000
+
+class CachedEmbeddings(Embeddings):
+    """Content-hash keyed embedding cache in front of another Embeddings object.
+
+    Lookups go to an in-process LRU first, then to a SQLite file shared by
+    every process on the host (WAL mode, so readers never block). Only texts
+    missing from both tiers are sent to the wrapped embeddings, in one batch.
+    Both tiers hold float32 vectors; the memory tier is capped in bytes and
+    the disk tier in rows, each evicting the least recently used first.
+    """
+
+    def __init__(self, embeddings: Embeddings,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                 max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_rows: int = DEFAULT_MAX_DISK_ROWS):
+        self.embeddings = embeddings
+        self.cache_path = cache_path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_rows = max_disk_rows
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        # Guards only the in-memory LRU and counters, so the event loop never waits on SQLite
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+            if "last_access" not in columns:
+                # Caches written before pruning start out equally old
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+            self._db.commit()
+
+    @property
+    def model(self) -> Optional[str]:
+        return getattr(self.embeddings, "model", None)
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        if vector.nbytes > self.max_memory_bytes:
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Resolve as many keys as possible from memory, then from disk."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self._hits["memory"] += 1
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if not missing or self._db is None:
+            return found
+        rows = []
+        with self._db_lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows += self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+            if rows:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                     [(now, key) for key, _ in rows])
+                self._db.commit()
+
+        disk = {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+        with self._lock:
+            for key, vector in disk.items():
+                self._remember(key, vector)
+            self._hits["disk"] += len(disk)
+        found.update(disk)
+        return found
+
+    def _store(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            self._misses += len(items)
+            for key, vector in items.items():
+                self._remember(key, vector)
+        if self._db is not None and items:
+            now = time.time()
+            rows = [(key, vector.tobytes(), now) for key, vector in items.items()]
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+                )
+                self._prune()
+                self._db.commit()
+
+    def _prune(self):
+        """Delete the least recently used rows past `max_disk_rows` (caller holds the db lock)."""
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_disk_rows:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                (count - self.max_disk_rows,)
+            )
+
+    @staticmethod
+    def _as_arrays(keys, vectors: List[List[float]]) -> Dict[str, np.ndarray]:
+        return {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(keys, vectors)}
+
+    def _pending(self, texts: List[str], keys: List[str], found: Dict[str, np.ndarray]) -> Dict[str, str]:
+        """Map each uncached key to its text (deduplicated)."""
+        return {key: text for key, text in zip(keys, texts) if key not in found}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+        pending = self._pending(texts, keys, found)
+        if pending:
+            new = self._as_arrays(pending.keys(), self.embeddings.embed_documents(list(pending.values())))
+            self._store(new)
+            found.update(new)
+        # Lists only at the boundary: cached vectors stay compact float32 arrays
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key not in found:
+            vector = self.embeddings.embed_query(text)
+            self._store(self._as_arrays([key], [vector]))
+            return vector
+        return found[key].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        found = await asyncio.to_thread(self._lookup, keys)
+        pending = self._pending(texts, keys, found)
+        if pending:
+            vectors = await self.embeddings.aembed_documents(list(pending.values()))
+            new = self._as_arrays(pending.keys(), vectors)
+            await asyncio.to_thread(self._store, new)
+            found.update(new)
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                # Memory hits are answered without leaving the event loop
+                self._memory.move_to_end(key)
+                self._hits["memory"] += 1
+        if vector is not None:
+            return vector.tolist()
+
+        found = await asyncio.to_thread(self._lookup, [key])
+        if key in found:
+            return found[key].tolist()
+        vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self._store, self._as_arrays([key], [vector]))
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_hits": self._hits["memory"],
+                "disk_hits": self._hits["disk"],
+                "misses": self._misses
+            }
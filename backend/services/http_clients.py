@@ -0,0 +1,182 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+# Idle connections are kept for a minute, well past the gap between turns of a conversation
+DEFAULT_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+CONNECT_TIMEOUT = 5.0
+POOL_TIMEOUT = 10.0
+# HTTP/2 multiplexes concurrent requests over one connection; httpx needs the h2 package for it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class ConnectionStats:
+    """Requests sent vs connections opened by one client, from httpcore trace events."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.connect_errors = 0
+        self.connect_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, event: str, started: Dict[str, float]):
+        name, _, phase = event.rpartition(".")
+        now = time.perf_counter()
+        if phase == "started":
+            started[name] = now
+            return
+        with self._lock:
+            if name.endswith(".send_request_headers"):
+                if phase == "complete":
+                    self.requests += 1
+            elif name in ("connection.connect_tcp", "connection.start_tls"):
+                self.connect_seconds += now - started.get(name, now)
+                if phase == "failed":
+                    self.connect_errors += 1
+                elif name == "connection.connect_tcp":
+                    self.connections += 1
+                else:
+                    self.tls_handshakes += 1
+
+    def request_hook(self, request: httpx.Request):
+        """httpx request hook for a sync client: traces the request's connection events."""
+        started: Dict[str, float] = {}
+        request.extensions["trace"] = lambda event, info: self._record(event, started)
+
+    async def arequest_hook(self, request: httpx.Request):
+        """The same for an async client, whose trace callbacks are awaited."""
+        started: Dict[str, float] = {}
+
+        async def trace(event: str, info: dict):
+            self._record(event, started)
+
+        request.extensions["trace"] = trace
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            reused = max(self.requests - self.connections, 0)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections,
+                "tls_handshakes": self.tls_handshakes,
+                "connect_errors": self.connect_errors,
+                "reused_requests": reused,
+                "reuse_ratio": reused / self.requests if self.requests else 0.0,
+                "avg_connect_ms": 1000 * self.connect_seconds / self.connections if self.connections else 0.0
+            }
+
+class OpenAIHttpClients:
+    """Keep-alive HTTP clients shared by every OpenAI chat model and embeddings object.
+
+    Left to themselves, the chat model, the classifier and the embeddings
+    each open their own connection pool, so a request could pay for three
+    TCP + TLS handshakes on cold pools. Models made here share one sync and
+    one async client and keep only their own request timeout; connect and
+    pool timeouts are common to all of them.
+    """
+
+    def __init__(self, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 limits: httpx.Limits = DEFAULT_LIMITS,
+                 http2: Optional[bool] = None):
+        self.api_key = api_key
+        self.base_url = (
+            base_url or os.getenv("OPENAI_BASE_URL") or os.getenv("OPENAI_API_BASE") or DEFAULT_BASE_URL
+        ).rstrip("/")
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.sync_stats = ConnectionStats()
+        self.async_stats = ConnectionStats()
+        self.sync_client = httpx.Client(
+            http2=self.http2, limits=limits, timeout=self.timeout(60.0),
+            event_hooks={"request": [self.sync_stats.request_hook]}
+        )
+        # Bound to the event loop that first uses it: the server's
+        self.async_client = httpx.AsyncClient(
+            http2=self.http2, limits=limits, timeout=self.timeout(60.0),
+            event_hooks={"request": [self.async_stats.arequest_hook]}
+        )
+
+    @staticmethod
+    def timeout(seconds: float) -> httpx.Timeout:
+        """A request timeout of `seconds` with the shared connect and pool timeouts."""
+        return httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds), pool=POOL_TIMEOUT)
+
+    def chat_model(self, timeout: float, **kwargs) -> ChatOpenAI:
+        return ChatOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=self.sync_client,
+            http_async_client=self.async_client,
+            timeout=self.timeout(timeout),
+            **kwargs
+        )
+
+    def embeddings(self, timeout: float, **kwargs) -> OpenAIEmbeddings:
+        return OpenAIEmbeddings(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=self.sync_client,
+            http_async_client=self.async_client,
+            timeout=self.timeout(timeout),
+            **kwargs
+        )
+
+    def _warm_up_request(self) -> Dict[str, str]:
+        # Listing models is free; any response, even an auth error, leaves the connection open
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        return {"url": f"{self.base_url}/models", "headers": headers}
+
+    def warm_up(self, connections: int = 2) -> int:
+        """Open up to `connections` sync connections before the first request needs one."""
+        def ping(_) -> bool:
+            try:
+                self.sync_client.get(**self._warm_up_request(), timeout=self.timeout(CONNECT_TIMEOUT))
+                return True
+            except httpx.HTTPError as e:
+                print(f"Warning: could not warm up an API connection: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="warm-up") as executor:
+            return sum(executor.map(ping, range(connections)))
+
+    async def awarm_up(self, connections: int = 2) -> int:
+        """Open up to `connections` async connections; call from the event loop that will use them."""
+        async def ping() -> bool:
+            try:
+                await self.async_client.get(**self._warm_up_request(), timeout=self.timeout(CONNECT_TIMEOUT))
+                return True
+            except httpx.HTTPError as e:
+                print(f"Warning: could not warm up an API connection: {str(e)}")
+                return False
+
+        return sum(await asyncio.gather(*(ping() for _ in range(connections))))
+
+    def stats(self) -> Dict[str, object]:
+        return {"http2": self.http2, "sync": self.sync_stats.stats(), "async": self.async_stats.stats()}
+
+    def collect_metrics(self) -> Iterator[tuple]:
+        """Samples for /metrics: requests sent and connections opened, per client."""
+        for client, stats in (("sync", self.sync_stats.stats()), ("async", self.async_stats.stats())):
+            labels = {"client": client}
+            yield ("buildmate_http_requests_total", "counter", "Requests sent to the OpenAI API.",
+                   labels, stats["requests"])
+            yield ("buildmate_http_connections_opened_total", "counter",
+                   "Connections opened to the OpenAI API; requests minus these reused a connection.",
+                   labels, stats["connections_opened"])
+            yield ("buildmate_http_connect_errors_total", "counter", "Failed connection attempts to the OpenAI API.",
+                   labels, stats["connect_errors"])
+
+    def close(self):
+        self.sync_client.close()
+
+    async def aclose(self):
+        await self.async_client.aclose()
+        self.close()
@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from .query_classifier import QueryClassifier, QueryType
+
+QUERY_TYPES = [
+    "safety", "installation", "specifications", "comparison",
+    "compliance", "commercial", "general", "other"
+]
+
+# Hand-labelled seed queries, "other" included; test/classifier_benchmark.py --relabel
+# replaces them with LLM labels for every qa_pairs.json and typical_queries question
+LABELS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "classifier_labels.json"
+)
+
+# Keyword rules per query type. A rule only fires when exactly one type matches.
+RULES = {
+    "safety": r"\b(safety|safe|ppe|hazard\w*|protective|gloves?|goggles|respirator|dust mask|msds|sds|first aid|toxic\w*|injur\w*)\b",
+    "installation": r"\b(install\w*|mount\w*|step[- ]by[- ]step|how (do|to|should) (i|you|we) (attach|fasten|nail|screw|hang|lay|frame|cut|seal))\b",
+    "specifications": r"\b(dimensions?|specs?|specifications?|weigh(t|s)|moisture content|thickness|psi|modulus|span rating|bending strength|grade stamp|retention)\b",
+    "comparison": r"\b(vs\.?|versus|compare[ds]?|comparison|better than|which is better|difference between|alternatives?)\b",
+    "compliance": r"\b(building codes?|code requirements?|ibc|irc|regulations?|permits?|complian\w*|inspections?|certif\w*)\b",
+    "commercial": r"\b(prices?|pricing|how much|buy|purchas\w*|in stock|stock levels?|availability|wholesale|bulk|discounts?|lead times?|suppliers?)\b"
+}
+RULE_CONFIDENCE = 0.95
+
+# Rule keywords are generic ("install", "price", "safe"), so a rule only fires on a query
+# that is also about building materials: it names a material or trade term, or an id.
+DOMAIN_TERMS = (
+    r"\b(lumber|wood\w*|timber|plywood|osb|cdx|drywall|gypsum|sheathing|subfloor\w*|flooring|decks?|decking|"
+    r"joists?|studs?|rafters?|trusse?s?|beams?|posts?|headers?|framing|sill plates?|2x\d+|4x4|"
+    r"concrete|cement|mortar|grout|masonry|bricks?|cinder ?blocks?|rebar|footings?|foundations?|slabs?|"
+    r"steel|galvani[sz]ed|stainless|fasteners?|nails?|screws?|bolts?|anchors?|hangers?|connectors?|"
+    r"roof\w*|shingles?|siding|insulation|vapor barriers?|house ?wrap|flashing|"
+    r"adhesives?|sealants?|caulk\w*|primers?|stains?|preservatives?|pressure[- ]treated|treated|acq|cca|"
+    r"building|construction|contractors?|builders?|carpent\w*|materials?|spans?|load[- ]bearing)\b"
+)
+# Id shapes used in the catalogue: LUM-2x4-8-PT, PLY-CDX-23/32, IBC-2021-2304, SD-PT-001
+ID_SHAPE = r"\b[A-Za-z]{2,4}(-[A-Za-z0-9/]+)*-[A-Za-z0-9/]*\d[A-Za-z0-9/]*"
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word unigrams plus bigrams."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class RuleClassifier:
+    """Regex keyword layer: cheap and precise, but only for unambiguous, on-topic queries.
+
+    Off-topic queries ("How do I install Python?") are left to the later
+    tiers, which can answer "other".
+    """
+
+    def __init__(self, rules: Dict[str, str] = RULES, confidence: float = RULE_CONFIDENCE,
+                 domain: str = DOMAIN_TERMS, id_shape: str = ID_SHAPE):
+        self.patterns = {label: re.compile(pattern, re.IGNORECASE) for label, pattern in rules.items()}
+        self.domain = re.compile(domain, re.IGNORECASE)
+        self.id_shape = re.compile(id_shape)
+        self.confidence = confidence
+
+    def is_on_topic(self, query: str) -> bool:
+        return bool(self.domain.search(query) or self.id_shape.search(query))
+
+    def classify(self, query: str) -> Optional[Tuple[str, float]]:
+        if not self.is_on_topic(query):
+            return None
+        matches = [label for label, pattern in self.patterns.items() if pattern.search(query)]
+        if len(matches) != 1:
+            return None
+        return matches[0], self.confidence
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over word uni/bigrams, trained from LLM-labelled queries."""
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.class_log_priors: Dict[str, float] = {}
+        self.token_log_probs: Dict[str, Dict[str, float]] = {}
+        self.unknown_log_probs: Dict[str, float] = {}
+
+    @property
+    def is_trained(self) -> bool:
+        return bool(self.class_log_priors)
+
+    def fit(self, texts: List[str], labels: List[str]) -> "NaiveBayesClassifier":
+        class_counts = Counter(labels)
+        token_counts: Dict[str, Counter] = defaultdict(Counter)
+        vocabulary = set()
+        for text, label in zip(texts, labels):
+            tokens = tokenize(text)
+            token_counts[label].update(tokens)
+            vocabulary.update(tokens)
+
+        total = sum(class_counts.values())
+        vocabulary_size = len(vocabulary) or 1
+        self.class_log_priors = {label: math.log(count / total) for label, count in class_counts.items()}
+        self.token_log_probs = {}
+        self.unknown_log_probs = {}
+        for label in class_counts:
+            denominator = sum(token_counts[label].values()) + self.alpha * vocabulary_size
+            self.token_log_probs[label] = {
+                token: math.log((count + self.alpha) / denominator)
+                for token, count in token_counts[label].items()
+            }
+            self.unknown_log_probs[label] = math.log(self.alpha / denominator)
+        return self
+
+    def predict(self, query: str) -> Optional[Tuple[str, float]]:
+        """Return the most likely label and its posterior probability."""
+        if not self.is_trained:
+            return None
+        tokens = tokenize(query)
+        scores = {}
+        for label, prior in self.class_log_priors.items():
+            log_probs = self.token_log_probs[label]
+            unknown = self.unknown_log_probs[label]
+            scores[label] = prior + sum(log_probs.get(token, unknown) for token in tokens)
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+def classify_locally(query: str, rules: RuleClassifier, model: NaiveBayesClassifier,
+                     threshold: float) -> Optional[Tuple[str, str]]:
+    """Return (label, tier) from the first local tier confident enough, otherwise None.
+
+    The model only answers a building-material type for on-topic queries;
+    off-topic ones it does not call "other" are left to the LLM.
+    """
+    result = rules.classify(query)
+    if result and result[1] >= threshold:
+        return result[0], "rules"
+    result = model.predict(query)
+    if result and result[1] >= threshold and (result[0] == "other" or rules.is_on_topic(query)):
+        return result[0], "model"
+    return None
+
+def load_labelled_queries(path: str = LABELS_PATH) -> List[Dict[str, str]]:
+    """Load [{"query": ..., "label": ...}] pairs, or an empty list if none were generated."""
+    try:
+        with open(path, 'r') as file:
+            return [item for item in json.load(file) if item.get("label") in QUERY_TYPES]
+    except (OSError, ValueError):
+        return []
+
+class TieredQueryClassifier:
+    """Rule layer, then a local model, then the LLM classifier below `confidence_threshold`.
+
+    Exposes the same classify methods as QueryClassifier and counts how
+    many queries each tier answered.
+    """
+
+    TIERS = ("rules", "model", "llm")
+
+    def __init__(self, llm_classifier: QueryClassifier,
+                 confidence_threshold: float = 0.85,
+                 labels_path: str = LABELS_PATH):
+        self.llm_classifier = llm_classifier
+        self.confidence_threshold = confidence_threshold
+        self.rules = RuleClassifier()
+        self.model = NaiveBayesClassifier()
+
+        examples = load_labelled_queries(labels_path)
+        if examples:
+            self.model.fit([item["query"] for item in examples], [item["label"] for item in examples])
+            print(f"Local query classifier trained on {len(examples)} labelled queries")
+        else:
+            print("No labelled queries found, local classifier uses rules only")
+
+        self._hits = Counter()
+        self._lock = threading.Lock()
+
+    def _record(self, tier: str):
+        with self._lock:
+            self._hits[tier] += 1
+
+    def classify_locally(self, query: str) -> Optional[Tuple[str, str]]:
+        """Return (label, tier) if a local tier is confident enough, otherwise None."""
+        return classify_locally(query, self.rules, self.model, self.confidence_threshold)
+
+    def classify_query(self, query: str) -> QueryType:
+        local = self.classify_locally(query)
+        if local:
+            self._record(local[1])
+            return QueryType(primary_type=local[0])
+        self._record("llm")
+        return self.llm_classifier.classify_query(query)
+
+    async def aclassify_query(self, query: str, timeout: Optional[float] = None) -> QueryType:
+        local = self.classify_locally(query)
+        if local:
+            self._record(local[1])
+            return QueryType(primary_type=local[0])
+        self._record("llm")
+        return await self.llm_classifier.aclassify_query(query, timeout=timeout)
+
+    async def aclassify_queries(self, queries: List[str]) -> List[QueryType]:
+        results: List[Optional[QueryType]] = []
+        pending = []
+        for i, query in enumerate(queries):
+            local = self.classify_locally(query)
+            if local:
+                self._record(local[1])
+                results.append(QueryType(primary_type=local[0]))
+            else:
+                self._record("llm")
+                results.append(None)
+                pending.append(i)
+
+        if pending:
+            llm_results = await self.llm_classifier.aclassify_queries([queries[i] for i in pending])
+            for i, result in zip(pending, llm_results):
+                results[i] = result
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        """Per-tier hit counts and hit rates."""
+        with self._lock:
+            total = sum(self._hits.values())
+            stats = {"total": total}
+            for tier in self.TIERS:
+                stats[f"{tier}_hits"] = self._hits[tier]
+                stats[f"{tier}_hit_rate"] = self._hits[tier] / total if total else 0.0
+            return stats
@@ -0,0 +1,283 @@
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Seconds; spans range from sub-millisecond id lookups to multi-second generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus bucket layout."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts = self._values.get(_label_key(self.labelnames, labels))
+            return int(sum(counts[:-1])) if counts else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, key))
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {_format_value(cumulative)}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {repr(counts[-1])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return lines
+
+# A collector returns (name, type, help, labels, value) samples read at scrape time,
+# for components that already keep their own counters (caches, session memory)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        collected: Dict[str, List[Sample]] = defaultdict(list)
+        for collector in collectors:
+            try:
+                for sample in collector():
+                    collected[sample[0]].append(sample)
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {str(e)}")
+        for name, samples in collected.items():
+            _, metric_type, documentation, _, _ = samples[0]
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for _, _, _, labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "buildmate_stage_duration_seconds", "Time spent in each chat pipeline stage.", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "buildmate_request_duration_seconds", "End-to-end chat request time.", ("kind", "status"))
+STAGE_ERRORS = REGISTRY.counter(
+    "buildmate_stage_errors_total", "Errors (including timeouts) raised in each pipeline stage.", ("stage", "error"))
+TOKENS = REGISTRY.counter(
+    "buildmate_tokens_total", "Tokens sent to or received from the chat model.", ("kind",))
+TRACES_DROPPED = REGISTRY.counter(
+    "buildmate_traces_dropped_total", "Sampled traces dropped because the log queue was full.")
+
+class Trace:
+    """Spans and attributes of one chat request."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float, Optional[str]]] = []  # (stage, offset, duration, error)
+        self.attributes: Dict[str, object] = {}
+        self.status = "ok"
+        self.duration: Optional[float] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def has_errors(self) -> bool:
+        return self.status != "ok" or any(error for *_, error in self.spans)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "trace_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "duration_ms": round((self.duration or 0.0) * 1000, 1),
+            "spans": [
+                {"stage": stage, "offset_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1),
+                 **({"error": error} if error else {})}
+                for stage, offset, duration, error in self.spans
+            ],
+            **self.attributes
+        }
+
+class TraceLogger:
+    """Writes finished traces as JSON lines from a background thread.
+
+    Only a `sample_rate` share of traces is logged, plus every failed or
+    slow one. Requests never wait on the log: traces are handed over with a
+    non-blocking put and dropped (and counted) when the queue is full.
+    """
+
+    def __init__(self, sample_rate: float = 0.1, slow_seconds: float = 5.0, maxsize: int = 1000):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def should_log(self, trace: Trace) -> bool:
+        if trace.has_errors or (trace.duration or 0.0) >= self.slow_seconds:
+            return True
+        return random.random() < self.sample_rate
+
+    def log(self, trace: Trace):
+        if not self.should_log(trace):
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            TRACES_DROPPED.inc()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-logger", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            print(f"trace {json.dumps(record, default=str)}")
+
+    def flush(self, timeout: float = 1.0):
+        """Wait (briefly) for queued traces to be written, e.g. in tests or on shutdown."""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+TRACE_LOGGER = TraceLogger()
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("buildmate_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace_request(kind: str, logger: Optional[TraceLogger] = None) -> Iterator[Trace]:
+    """Trace one request: spans opened inside (tasks and to_thread calls included) attach to it."""
+    trace = Trace(kind)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.status = "cancelled" if not isinstance(e, Exception) else "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator finalized from another context
+            pass
+        trace.duration = time.perf_counter() - trace.start
+        REQUEST_SECONDS.observe(trace.duration, kind=kind, status=trace.status)
+        (logger or TRACE_LOGGER).log(trace)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the current trace, counting its errors."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        STAGE_ERRORS.inc(stage=stage, error=error)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, start - trace.start, duration, error))
@@ -1,14 +1,18 @@
+import asyncio
+from typing import List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
+from .metrics import STAGE_ERRORS, current_trace
 
 class QueryType(BaseModel):
     """Classification of a building materials query."""
     primary_type: str = Field(description="Primary type of the query (safety/installation/specifications/comparison/compliance/commercial/general/other)")
 
 class QueryClassifier:
-    def __init__(self, api_key: str):
-        self.classifier_llm = ChatOpenAI(
+    def __init__(self, api_key: str, classifier_llm: Optional[ChatOpenAI] = None):
+        # The chat service passes a model on its shared HTTP clients
+        self.classifier_llm = classifier_llm or ChatOpenAI(
             api_key=api_key,
             model="gpt-4o-mini",
             temperature=0
@@ -41,16 +45,43 @@ class QueryClassifier:
         
         self.classifier_chain = self.classifier_prompt | self.classifier_llm.with_structured_output(QueryType)
 
+    @staticmethod
+    def _fallback(error: Exception) -> QueryType:
+        """Count a failed classification (timeouts included) before falling back to 'other'."""
+        STAGE_ERRORS.inc(stage="classify", error=type(error).__name__)
+        trace = current_trace()
+        if trace is not None:
+            trace.set(classify_error=f"{type(error).__name__}: {str(error)}")
+        return QueryType(primary_type="other")
+
     def classify_query(self, query: str) -> QueryType:
         """Identify query type using LLM classification."""
         try:
-            result = self.classifier_chain.invoke({"query": query})
-            print(f"Query classified as: {result.primary_type}")
+            return self.classifier_chain.invoke({"query": query})
+        except Exception as e:
+            return self._fallback(e)
+
+    async def aclassify_query(self, query: str, timeout: Optional[float] = None) -> QueryType:
+        """Identify query type using async LLM classification, bounded by `timeout` seconds."""
+        try:
+            result = await asyncio.wait_for(
+                self.classifier_chain.ainvoke({"query": query}),
+                timeout=timeout
+            )
             return result
-            
         except Exception as e:
-            print(f"Error in query classification: {str(e)}")
-            return QueryType(primary_type="other")
+            return self._fallback(e)
+
+    async def aclassify_queries(self, queries: List[str]) -> List[QueryType]:
+        """Classify many queries concurrently with a single abatch call."""
+        results = await self.classifier_chain.abatch(
+            [{"query": query} for query in queries],
+            return_exceptions=True
+        )
+        return [
+            self._fallback(result) if isinstance(result, Exception) else result
+            for result in results
+        ]
 
 def main():
     import os
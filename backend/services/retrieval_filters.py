@@ -0,0 +1,83 @@
+import re
+from typing import Iterable, List, Optional
+
+# Query types whose answers live in a single kind of document
+DOC_TYPE_FILTERS = {
+    "safety": ["safety_document"],
+    "compliance": ["building_code"],
+    "commercial": ["product"]
+}
+
+def _sql_list(values: Iterable[str]) -> str:
+    return ", ".join("'" + value.replace("'", "''") + "'" for value in values)
+
+def doc_type_filter(doc_types: List[str]) -> str:
+    return f"metadata.doc_type IN ({_sql_list(doc_types)})"
+
+def product_filter(product_ids: List[str]) -> str:
+    """Rows about any of the products: their own docs, codes that apply to them, queries that cite them."""
+    ids = _sql_list(product_ids)
+    return (
+        f"metadata.product_id IN ({ids})"
+        f" OR array_has_any(metadata.applicable_products, [{ids}])"
+        f" OR array_has_any(metadata.relevant_products, [{ids}])"
+    )
+
+def product_record_filter(product_ids: List[str]) -> str:
+    """Only the products' own catalog entries."""
+    return f"metadata.doc_type = 'product' AND metadata.product_id IN ({_sql_list(product_ids)})"
+
+def combine_filters(*filters: Optional[str]) -> Optional[str]:
+    """AND together the non-empty filters, or None if there are none."""
+    filters = [f for f in filters if f]
+    if not filters:
+        return None
+    return " AND ".join(f"({f})" for f in filters)
+
+def load_product_ids(table) -> List[str]:
+    """Every product id referenced by the table's metadata."""
+    metadata = table.search().select(["metadata"]).limit(None).to_arrow().column("metadata").to_pylist()
+    product_ids = set()
+    for row in metadata:
+        row = row or {}
+        if row.get("product_id"):
+            product_ids.add(row["product_id"])
+        for field in ("applicable_products", "relevant_products"):
+            product_ids.update(row.get(field) or [])
+    return sorted(product_ids)
+
+class IdMatcher:
+    """Finds known ids (e.g. LUM-2x4-8-PT, IBC-2021-2304) mentioned in a query, case-insensitively."""
+
+    def __init__(self, ids: Iterable[str]):
+        self.ids = {known_id.lower(): known_id for known_id in ids}
+        self.pattern = None
+        if self.ids:
+            # Longest first so an id never matches as a prefix of a longer one
+            alternatives = "|".join(re.escape(i) for i in sorted(self.ids.values(), key=len, reverse=True))
+            self.pattern = re.compile(rf"(?<![\w-])({alternatives})(?![\w-])", re.IGNORECASE)
+
+    def find(self, query: str) -> List[str]:
+        if self.pattern is None:
+            return []
+        found = (self.ids[match.lower()] for match in self.pattern.findall(query))
+        return list(dict.fromkeys(found))
+
+    def lookup_ids(self, query: str, max_other_words: int = 3) -> List[str]:
+        """Ids if the query is essentially an id lookup ("LUM-2x4-8-PT specs"), else []."""
+        ids = self.find(query)
+        if not ids:
+            return []
+        remainder = self.pattern.sub(" ", query)
+        return ids if len(re.findall(r"\w+", remainder)) <= max_other_words else []
+
+def retrieval_filters(query_type: str, product_ids: List[str]) -> List[Optional[str]]:
+    """Filters to try in order, from most to least specific, ending with an unfiltered search.
+
+    Retrieval stops at the first filter that matches anything.
+    """
+    doc_types = DOC_TYPE_FILTERS.get(query_type)
+    type_filter = doc_type_filter(doc_types) if doc_types else None
+    ids_filter = product_filter(product_ids) if product_ids else None
+    candidates = [combine_filters(type_filter, ids_filter), ids_filter, type_filter, None]
+    return list(dict.fromkeys(candidates))
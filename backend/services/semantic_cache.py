@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from .query_classifier import QueryType
+
+# Sizes and quantities (2x4x8, 23/32, 12): queries differing only in these must not share an answer
+NUMBER_PATTERN = re.compile(r"\d+(?:[./x]\d+)*")
+
+def cache_key(query: str, ids: List[str]) -> str:
+    """The ids and numbers a query names; a cached answer only serves queries with the same key."""
+    numbers = NUMBER_PATTERN.findall(query.lower())
+    return "|".join(sorted(set(ids)) + sorted(set(numbers)))
+
+class CachedResponse:
+    """A cached first-turn answer and what it was built from."""
+
+    def __init__(self, query: str, query_type: QueryType, doc_ids: List[str], response: str):
+        self.query = query
+        self.query_type = query_type
+        self.doc_ids = doc_ids
+        self.response = response
+
+class SemanticResponseCache:
+    """LRU cache of responses keyed by query embedding similarity.
+
+    Embeddings live in a preallocated matrix so a lookup is a single
+    matrix-vector product. Entries are tagged with the index version they
+    were generated against, and the cache empties itself when that changes.
+    Similar queries still only match when they share a `cache_key`, since
+    embeddings barely move when just a product id or a size changes.
+    """
+
+    def __init__(self, max_entries: int = 512, similarity_threshold: float = 0.97):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.index_version: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: Dict[int, CachedResponse] = {}
+        self._keys: Dict[int, str] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version: Optional[str]):
+        if index_version != self.index_version:
+            self._matrix = None
+            self._entries.clear()
+            self._keys.clear()
+            self._lru.clear()
+            self.index_version = index_version
+
+    def lookup(self, embedding: List[float], index_version: Optional[str] = None,
+               key: str = "") -> Optional[CachedResponse]:
+        """Return the closest cached response with the same key if it clears the similarity threshold."""
+        with self._lock:
+            self._check_version(index_version)
+            slots = np.fromiter((slot for slot, entry_key in self._keys.items() if entry_key == key), dtype=np.int64)
+            if not len(slots):
+                self._misses += 1
+                return None
+
+            similarities = self._matrix[slots] @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self._misses += 1
+                return None
+
+            slot = int(slots[best])
+            self._lru.move_to_end(slot)
+            self._hits += 1
+            return self._entries[slot]
+
+    def store(self, embedding: List[float], entry: CachedResponse, index_version: Optional[str] = None,
+              key: str = ""):
+        """Insert a response, evicting the least recently used entry when full."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if self._matrix is None or self._matrix.shape[1] != len(vector):
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._entries.clear()
+                self._keys.clear()
+                self._lru.clear()
+
+            if len(self._entries) < self.max_entries:
+                # Slots fill in order and are only ever freed by clearing the cache
+                slot = len(self._entries)
+            else:
+                slot, _ = self._lru.popitem(last=False)
+
+            self._matrix[slot] = vector
+            self._entries[slot] = entry
+            self._keys[slot] = key
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._entries.clear()
+            self._keys.clear()
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from .token_counter import count_tokens
+
+# Per-message overhead the chat format adds on top of the content tokens
+MESSAGE_TOKEN_OVERHEAD = 4
+
+class _Session:
+    """Bounded conversation history for a single session."""
+
+    def __init__(self):
+        self.turns: Deque[Tuple[str, str, int]] = deque()
+        self.tokens = 0
+        self.last_access = time.monotonic()
+
+    def append(self, role: str, content: str, tokens: int):
+        self.turns.append((role, content, tokens))
+        self.tokens += tokens
+
+    def trim(self, max_tokens: int) -> int:
+        """Drop the oldest turns until the session fits in `max_tokens`; return tokens freed."""
+        freed = 0
+        while self.turns and self.tokens > max_tokens:
+            _, _, tokens = self.turns.popleft()
+            self.tokens -= tokens
+            freed += tokens
+        return freed
+
+    def to_messages(self) -> List[BaseMessage]:
+        return [
+            HumanMessage(content=content) if role == "user" else AIMessage(content=content)
+            for role, content, _ in self.turns
+        ]
+
+class SessionMemoryStore:
+    """Session-keyed conversation memory with per-session token budgets.
+
+    Sessions are evicted least-recently-used first when `max_sessions` or
+    `max_total_tokens` is exceeded, and expire after `session_ttl` seconds of
+    inactivity. The client-supplied message list is the source of truth, so a
+    session that was evicted (or lost in a restart) is rebuilt from it.
+    """
+
+    def __init__(self,
+                 max_tokens_per_session: int = 2000,
+                 max_sessions: int = 1000,
+                 max_total_tokens: int = 500_000,
+                 session_ttl: float = 3600,
+                 model: str = "gpt-4o-mini"):
+        self.max_tokens_per_session = max_tokens_per_session
+        self.max_sessions = max_sessions
+        self.max_total_tokens = max_total_tokens
+        self.session_ttl = session_ttl
+        self.model = model
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._total_tokens = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, content: str) -> int:
+        return count_tokens(content, self.model) + MESSAGE_TOKEN_OVERHEAD
+
+    def _build_session(self, client_messages: List[Dict]) -> _Session:
+        """Rebuild a session from the client's message list, keeping only the newest turns."""
+        session = _Session()
+        budget = self.max_tokens_per_session
+        kept = []
+        for message in reversed(client_messages):
+            role = message.get("role")
+            content = message.get("content") or ""
+            if role not in ("user", "assistant") or not content:
+                continue
+            tokens = self._count(content)
+            if session.tokens + tokens > budget:
+                break
+            session.tokens += tokens
+            kept.append((role, content, tokens))
+        session.turns.extend(reversed(kept))
+        return session
+
+    def _remove(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._total_tokens -= session.tokens
+
+    def _evict(self):
+        """Expire idle sessions, then evict LRU sessions until both caps hold."""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.session_ttl:
+                break
+            self._remove(session_id)
+            self._evictions += 1
+
+        while self._sessions and (len(self._sessions) > self.max_sessions
+                                  or self._total_tokens > self.max_total_tokens):
+            self._remove(next(iter(self._sessions)))
+            self._evictions += 1
+
+    def get_history_with_tokens(self, session_id: Optional[str],
+                                client_messages: List[Dict]) -> Tuple[List[BaseMessage], int]:
+        """Return the bounded chat history for a session and its token count.
+
+        `client_messages` should exclude the query being answered. Requests
+        without a session id get a transient, budgeted history built from
+        the client messages alone.
+        """
+        if not session_id:
+            session = self._build_session(client_messages)
+            return session.to_messages(), session.tokens
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._build_session(client_messages)
+                self._sessions[session_id] = session
+                self._total_tokens += session.tokens
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = time.monotonic()
+            history, tokens = session.to_messages(), session.tokens
+            self._evict()
+            return history, tokens
+
+    def save_turn(self, session_id: Optional[str], query: str, response: str):
+        """Append a query/response pair to a session and re-apply the budgets."""
+        if not session_id:
+            return
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _Session()
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+
+            for role, content in (("user", query), ("assistant", response)):
+                tokens = self._count(content)
+                session.append(role, content, tokens)
+                self._total_tokens += tokens
+            self._total_tokens -= session.trim(self.max_tokens_per_session)
+            session.last_access = time.monotonic()
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Return current occupancy and eviction counters."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "total_tokens": self._total_tokens,
+                "evictions": self._evictions
+            }
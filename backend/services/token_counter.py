@@ -0,0 +1,32 @@
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ships with langchain-openai, but stay usable without it
+    tiktoken = None
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """Load (once) the tokenizer used by the given OpenAI model."""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The BPE files are downloaded on first use; estimate when offline
+        print(f"Warning: tokenizer unavailable for {model}, estimating token counts: {str(e)}")
+        return None
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Count tokens in `text`, falling back to a 4-chars-per-token estimate."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
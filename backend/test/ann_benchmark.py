@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pyarrow as pa
+import lancedb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.process import EXPORT_DIR, ensure_vector_index
+from data.vector_export import load_export
+
+# (index_type, num_partitions or None for sqrt(rows), num_sub_vectors or None for the default)
+INDEX_SETTINGS = [
+    ("IVF_PQ", None, None),
+    ("IVF_PQ", None, "dim/8"),
+    ("IVF_HNSW_SQ", None, None)
+]
+# (nprobes, refine_factor)
+SEARCH_SETTINGS = [(10, None), (20, None), (20, 10), (50, 10)]
+
+def synthetic_corpus(rows: int, dimension: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit-norm vectors drawn around random centroids, roughly like embedding clusters."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, rows)] + 0.5 * rng.normal(size=(rows, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def corpus_from_export(rows: int, seed: int = 0) -> np.ndarray:
+    """Real embeddings from the binary export, tiled with small noise up to `rows`."""
+    vectors = np.asarray(load_export(EXPORT_DIR).vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), rows)]
+    picks = picks + 0.01 * rng.normal(size=picks.shape).astype(np.float32)
+    return picks / np.linalg.norm(picks, axis=1, keepdims=True)
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-k row ids by L2 distance (unit vectors: highest dot product)."""
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def make_table(db, vectors: np.ndarray):
+    data = pa.table({
+        "id": pa.array(np.arange(len(vectors))),
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), vectors.shape[1])
+    })
+    return db.create_table("bench", data=data, mode="overwrite")
+
+def run_queries(table, queries: np.ndarray, k: int, nprobes=None, refine_factor=None, exact=False):
+    """Return (result ids per query, latencies in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        search = table.search(query).limit(k).select(["id"])
+        if exact:
+            search = search.bypass_vector_index()
+        else:
+            search = search.nprobes(nprobes)
+            if refine_factor:
+                search = search.refine_factor(refine_factor)
+        start = time.perf_counter()
+        rows = search.to_arrow()
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(rows.column("id").to_pylist())
+    return results, latencies
+
+def recall_at_k(results, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(r) & set(t.tolist())) / k for r, t in zip(results, truth)]))
+
+def latency_summary(latencies) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
+
+def benchmark_size(rows: int, dimension: int, num_queries: int, k: int, use_export: bool) -> list:
+    vectors = corpus_from_export(rows) if use_export else synthetic_corpus(rows, dimension)
+    dimension = vectors.shape[1]
+    # Queries are perturbed corpus vectors, so every query has close neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, rows, num_queries)] + 0.05 * rng.normal(size=(num_queries, dimension)).astype(np.float32)
+    truth = exact_neighbours(vectors, queries, k)
+
+    reports = []
+    work_dir = tempfile.mkdtemp(prefix="ann_bench_")
+    try:
+        table = make_table(lancedb.connect(work_dir), vectors)
+        _, flat_latencies = run_queries(table, queries, k, exact=True)
+        reports.append({"rows": rows, "dim": dimension, "index": "flat", "recall": 1.0, **latency_summary(flat_latencies)})
+
+        for index_type, partitions, sub_vectors in INDEX_SETTINGS:
+            if sub_vectors == "dim/8":
+                sub_vectors = dimension // 8
+            start = time.perf_counter()
+            built = ensure_vector_index(table, min_rows=0, index_type=index_type,
+                                        num_partitions=partitions, num_sub_vectors=sub_vectors)
+            build_seconds = time.perf_counter() - start
+            if built is None:
+                continue
+            for nprobes, refine_factor in SEARCH_SETTINGS:
+                results, latencies = run_queries(table, queries, k, nprobes, refine_factor)
+                reports.append({
+                    "rows": rows,
+                    "dim": dimension,
+                    "index": index_type,
+                    "sub_vectors": sub_vectors,
+                    "build_s": round(build_seconds, 2),
+                    "nprobes": nprobes,
+                    "refine_factor": refine_factor,
+                    "recall": round(recall_at_k(results, truth), 4),
+                    **latency_summary(latencies)
+                })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and latency of LanceDB ANN indexes vs exact search")
+    parser.add_argument("--sizes", default="10000,50000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=256, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--export", action="store_true", help="tile the real embeddings from the vector export")
+    args = parser.parse_args()
+
+    for rows in (int(size) for size in args.sizes.split(",")):
+        print(f"\n=== {rows} rows ===")
+        for report in benchmark_size(rows, args.dim, args.queries, args.k, args.export):
+            print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
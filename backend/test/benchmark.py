@@ -1,16 +1,36 @@
-import numpy as np
-import pandas as pd
+import argparse
+import copy
 import json
-import ast
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
 from langchain_experimental.tabular_synthetic_data.openai import create_openai_data_generator
 from langchain_openai import ChatOpenAI
-from langchain.prompts import FewShotPromptTemplate, PromptTemplate
+from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_experimental.tabular_synthetic_data.prompts import (
     SYNTHETIC_FEW_SHOT_PREFIX,
     SYNTHETIC_FEW_SHOT_SUFFIX,
 )
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.embedding_pipeline import RETRYABLE_ERRORS, TokenBucket
+from data.process import (
+    CLEAN_DATA_PATH,
+    PROCESSORS,
+    format_document_content,
+    iter_source_records,
+    normalize_text
+)
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+QA_PAIRS_PATH = os.path.join(TEST_DIR, "qa_pairs.json")
+CHECKPOINT_PATH = os.path.join(TEST_DIR, "qa_pairs.checkpoint.jsonl")
 
 # Define the Q&A pair structure
 class QAPair(BaseModel):
@@ -50,50 +70,39 @@ examples = [
     }
 ]
 
-def extract_basic_info(text, metadata_str):
-    """Extract basic document info without strict parsing."""
-    try:
-        # Basic metadata extraction using string operations
-        if isinstance(metadata_str, str):
-            metadata = eval(metadata_str)
-        else:
-            metadata = metadata_str
-            
-        doc_type = metadata.get('doc_type', 'unknown')
-        product_id = metadata.get('product_id', 'unknown')
-        manufacturer = metadata.get('manufacturer', 'unknown')
-        category = metadata.get('category', 'unknown')
-        
-        return {
+def load_source_documents(source_path: str = CLEAN_DATA_PATH) -> Iterator[Dict[str, Any]]:
+    """Whole formatted source records, keyed by doc type and source id (no chunking)."""
+    for data_type, item in iter_source_records(source_path):
+        if data_type not in PROCESSORS:
+            continue
+        doc_type, id_field, metadata_func = PROCESSORS[data_type]
+        try:
+            metadata = metadata_func(item)
+            text = normalize_text(format_document_content(item, doc_type))
+        except Exception as e:
+            print(f"Warning: Error processing {data_type} item: {str(e)}")
+            continue
+        yield {
+            'doc_key': f"{doc_type}:{item.get(id_field)}",
             'doc_type': doc_type,
-            'product_id': product_id,
-            'manufacturer': manufacturer,
-            'category': category,
-            'text': text.strip()
-        }
-    except:
-        # If parsing fails, try to extract minimal info
-        return {
-            'doc_type': 'unknown',
-            'product_id': 'unknown',
-            'manufacturer': 'unknown',
-            'category': 'unknown',
-            'text': text.strip()
+            'product_id': metadata.get('product_id') or 'unknown',
+            'manufacturer': metadata.get('manufacturer') or 'unknown',
+            'category': metadata.get('category') or 'unknown',
+            'text': text
         }
 
-def generate_qa_pairs(data_path: str) -> list:
-    """Generate QA pairs from documentation with simplified processing."""
-    
-    print("Reading data...")
-    df = pd.read_csv(data_path)
-    
-    # Create the data generator
-    synthetic_data_generator = create_openai_data_generator(
+def make_generator(llm: ChatOpenAI):
+    """A data generator with its own copy of the few-shot examples.
+
+    The generator keeps its results and rotates generated pairs into its
+    examples, so each document gets a fresh one instead of sharing state.
+    """
+    return create_openai_data_generator(
         output_schema=QAPair,
-        llm=ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7),
+        llm=llm,
         prompt=FewShotPromptTemplate(
             prefix=SYNTHETIC_FEW_SHOT_PREFIX,
-            examples=examples,
+            examples=copy.deepcopy(examples),
             suffix=SYNTHETIC_FEW_SHOT_SUFFIX,
             input_variables=["subject", "extra"],
             example_prompt=PromptTemplate(
@@ -102,69 +111,167 @@ def generate_qa_pairs(data_path: str) -> list:
             ),
         ),
     )
-    
-    all_qa_pairs = []
-    processed_docs = set()
-    
-    # Process each unique document
-    for _, row in df.iterrows():
-        try:
-            # Extract basic info without strict parsing
-            doc_info = extract_basic_info(row['text'], row['metadata'])
-            doc_key = f"{doc_info['product_id']}_{doc_info['doc_type']}"
-            
-            # Skip if we've processed this document
-            if doc_key in processed_docs:
+
+def build_extra_prompt(doc: Dict[str, Any]) -> str:
+    return f"""Generate questions and answers about this building material document:
+        Product ID: {doc['product_id']}
+        Manufacturer: {doc['manufacturer']}
+        Category: {doc['category']}
+
+        Document Content:
+        {doc['text']}
+
+        Generate 5 specific questions and detailed answers about the key information in this document.
+        Focus on practical information that would be useful for someone working with or purchasing this material."""
+
+def _as_dict(qa: Any) -> Dict[str, str]:
+    return qa.model_dump() if isinstance(qa, BaseModel) else dict(qa)
+
+def generate_for_document(llm: ChatOpenAI, doc: Dict[str, Any], runs: int,
+                          request_bucket: TokenBucket, max_retries: int = 4) -> List[Dict[str, str]]:
+    """Generate `runs` QA pairs for one document, one rate-limited LLM call per run."""
+    generator = make_generator(llm)
+    extra = build_extra_prompt(doc)
+    for _ in range(runs):
+        for attempt in range(max_retries + 1):
+            request_bucket.acquire(1)
+            try:
+                generator.generate(subject="building_materials", extra=extra, runs=1)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    raise
+                delay = 2 ** attempt * (0.5 + random.random())
+                print(f"Warning: {doc['doc_key']} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    return [_as_dict(qa) for qa in generator.results]
+
+def load_checkpoint(checkpoint_path: str) -> Dict[str, Dict[str, Any]]:
+    """Completed documents by doc_key; a line cut off by a crash is ignored."""
+    completed = {}
+    if not os.path.exists(checkpoint_path):
+        return completed
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
                 continue
-            
-            processed_docs.add(doc_key)
-            
-            text = doc_info['text']
-            if not text or len(text) < 50:  # Skip very short texts
+            completed[record['doc_key']] = record
+    return completed
+
+def _terminate_last_line(path: str):
+    """End a line cut off by a crash, so the next appended record starts on its own line."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+def _question_words(question: str) -> frozenset:
+    return frozenset(re.findall(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*", question.lower()))
+
+def dedupe_qa_pairs(records: Iterable[Dict[str, Any]], similarity: float = 0.9) -> List[Dict[str, str]]:
+    """QA pairs without repeated questions, in checkpoint order.
+
+    A question is dropped if the same words were already asked anywhere, or
+    if it shares `similarity` (Jaccard) of its words with a question kept for
+    the same document; near-identical phrasings come from repeated runs.
+    """
+    seen = set()
+    kept = []
+    for record in records:
+        document_questions = []
+        for qa in record['qa_pairs']:
+            words = _question_words(qa.get('question', ''))
+            if not words or words in seen:
                 continue
-                
-            print(f"Processing: {doc_key}")
-            print(f"Text length: {len(text)}")
-            
-            # Generate prompt
-            extra_prompt = f"""Generate questions and answers about this building material document:
-                Product ID: {doc_info['product_id']}
-                Manufacturer: {doc_info['manufacturer']}
-                Category: {doc_info['category']}
-                
-                Document Content:
-                {text}
-                
-                Generate 5 specific questions and detailed answers about the key information in this document. 
-                Focus on practical information that would be useful for someone working with or purchasing this material."""
-            
-            # Generate QA pairs
-            qa_pairs = synthetic_data_generator.generate(
-                subject="building_materials",
-                extra=extra_prompt,
-                runs=5
-            )
-            
-            if qa_pairs:
-                all_qa_pairs.extend(qa_pairs)
-                print(f"Generated {len(qa_pairs)} Q&A pairs for {doc_key}")
-            
-        except Exception as e:
-            print(f"Error processing document: {str(e)}")
-            continue
-    
-    print(f"\nProcessed {len(processed_docs)} unique documents")
-    return all_qa_pairs
+            if any(len(words & other) / len(words | other) >= similarity for other in document_questions):
+                continue
+            seen.add(words)
+            document_questions.append(words)
+            kept.append({key: qa.get(key, '') for key in ('question', 'answer', 'context')})
+    return kept
+
+def generate_qa_pairs(source_path: str = CLEAN_DATA_PATH,
+                      checkpoint_path: str = CHECKPOINT_PATH,
+                      model: str = "gpt-3.5-turbo",
+                      runs: int = 5,
+                      max_workers: int = 8,
+                      requests_per_minute: float = 500,
+                      min_text_length: int = 50) -> List[Dict[str, Any]]:
+    """Generate QA pairs for every source document, resuming from the checkpoint.
+
+    Documents are generated concurrently (at most `max_workers` at a time,
+    `requests_per_minute` LLM calls overall) and each one is appended to the
+    JSONL checkpoint as soon as it finishes, so a rerun after a crash only
+    generates the documents that are missing. Returns the checkpoint records.
+    """
+    completed = load_checkpoint(checkpoint_path)
+    docs = [
+        doc for doc in {doc['doc_key']: doc for doc in load_source_documents(source_path)}.values()
+        if len(doc['text']) >= min_text_length  # Skip very short texts
+    ]
+    pending_docs = [doc for doc in docs if doc['doc_key'] not in completed]
+    print(f"{len(docs)} documents: {len(docs) - len(pending_docs)} already in {checkpoint_path}, "
+          f"{len(pending_docs)} to generate")
+
+    llm = ChatOpenAI(model=model, temperature=0.7)
+    request_bucket = TokenBucket(requests_per_minute)
+    start = time.perf_counter()
+    failed = 0
+    _terminate_last_line(checkpoint_path)
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qa") as executor:
+        futures = {
+            executor.submit(generate_for_document, llm, doc, runs, request_bucket): doc
+            for doc in pending_docs
+        }
+        for future in as_completed(futures):
+            doc = futures[future]
+            try:
+                qa_pairs = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Error processing {doc['doc_key']}: {str(e)}")
+                continue
+            record = {'doc_key': doc['doc_key'], 'doc_type': doc['doc_type'], 'qa_pairs': qa_pairs}
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            completed[doc['doc_key']] = record
+            print(f"Generated {len(qa_pairs)} Q&A pairs for {doc['doc_key']} "
+                  f"({len(completed)}/{len(docs)}, {time.perf_counter() - start:.1f}s)")
+
+    if failed:
+        print(f"{failed} documents failed; rerun to retry them")
+    return [completed[doc['doc_key']] for doc in docs if doc['doc_key'] in completed]
 
 def main():
-    # Generate QA pairs
-    qa_pairs = generate_qa_pairs('../data/building_materials_docs.csv')
-    
+    parser = argparse.ArgumentParser(description="Generate synthetic QA pairs for the retrieval benchmark")
+    parser.add_argument("--source", default=CLEAN_DATA_PATH, help="clean_data.json or a raw .txt dump")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="JSONL of finished documents, resumed on restart")
+    parser.add_argument("--output", default=QA_PAIRS_PATH)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--runs", type=int, default=5, help="QA pairs generated per document")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=float, default=500)
+    parser.add_argument("--similarity", type=float, default=0.9,
+                        help="word overlap above which two questions about a document are duplicates")
+    args = parser.parse_args()
+    load_dotenv()
+
+    records = generate_qa_pairs(args.source, args.checkpoint, args.model, args.runs,
+                                args.workers, args.requests_per_minute)
+    qa_pairs = dedupe_qa_pairs(records, args.similarity)
+
     # Save to JSON
-    with open('qa_pairs.json', 'w', encoding='utf-8') as f:
-        json.dump([qa.dict() for qa in qa_pairs], f, indent=2, ensure_ascii=False)
-    
-    print(f"Total Q&A pairs generated: {len(qa_pairs)}")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(qa_pairs, f, indent=2, ensure_ascii=False)
+
+    generated = sum(len(record['qa_pairs']) for record in records)
+    print(f"Total Q&A pairs: {len(qa_pairs)} ({generated - len(qa_pairs)} duplicates dropped) "
+          f"from {len(records)} documents")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import lancedb
+from dotenv import load_dotenv
+from langchain_text_splitters import CharacterTextSplitter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.chunker import StructuredChunker
+from data.process import CLEAN_DATA_PATH, iter_source_records, prepare_documents
+from services.token_counter import count_tokens
+from document_format_report import QA_PAIRS_PATH, context_coverage, make_table, search
+
+def legacy_splitter(chunk_size: int = 1000) -> CharacterTextSplitter:
+    """The fixed-size splitter used before the structured chunker (20% overlap)."""
+    return CharacterTextSplitter(separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_size // 5,
+                                 length_function=len)
+
+def chunk_rows(text_splitter, source_path: str = CLEAN_DATA_PATH) -> list:
+    docs = prepare_documents(list(iter_source_records(source_path)), text_splitter)
+    return [(doc["metadata"]["doc_type"], doc["content"]) for doc in docs]
+
+def index_stats(rows: list, embedding_batch_size: int = 64) -> dict:
+    texts = [text for _, text in rows]
+    return {
+        "chunks": len(texts),
+        "bytes": sum(len(text.encode("utf-8")) for text in texts),
+        "embedded_tokens": sum(count_tokens(text) for text in texts),
+        "embedding_requests": -(-len(texts) // embedding_batch_size)
+    }
+
+def precision_report(table, qa_pairs: list, mode: str, k: int, embeddings=None,
+                     relevant_coverage: float = 0.5) -> dict:
+    """Precision@k (a chunk is relevant if it holds `relevant_coverage` of the pair's context) and context coverage."""
+    precisions, coverages = [], []
+    for pair in qa_pairs:
+        retrieved = search(table, mode, pair["question"], k, embeddings)
+        context = pair.get("context", "")
+        relevant = sum(context_coverage(context, [text]) >= relevant_coverage for text in retrieved)
+        precisions.append(relevant / k)
+        coverages.append(context_coverage(context, retrieved))
+    return {
+        "precision_at_k": round(sum(precisions) / len(precisions), 4),
+        "mean_coverage": round(sum(coverages) / len(coverages), 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Index size and top-k precision: structured chunker vs fixed-size splitter")
+    parser.add_argument("--source", default=CLEAN_DATA_PATH)
+    parser.add_argument("--mode", choices=["fts", "vector", "hybrid"], default="fts",
+                        help="retrieval to compare; vector and hybrid embed both tables with OpenAI")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    load_dotenv()
+
+    embeddings = None
+    if args.mode != "fts":
+        from langchain_openai import OpenAIEmbeddings
+        from services.embedding_cache import CachedEmbeddings
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY")))
+
+    with open(QA_PAIRS_PATH, "r") as file:
+        qa_pairs = list({pair["question"]: pair for pair in json.load(file)}.values())
+
+    work_dir = tempfile.mkdtemp(prefix="chunking_report_")
+    try:
+        db = lancedb.connect(work_dir)
+        splitters = (
+            ("fixed_size", legacy_splitter(args.chunk_size)),
+            ("structured", StructuredChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_size // 5))
+        )
+        for name, text_splitter in splitters:
+            rows = chunk_rows(text_splitter, args.source)
+            table = make_table(db, name, rows, embeddings)
+            report = {"splitter": name, "chunk_size": args.chunk_size, "mode": args.mode, "k": args.k,
+                      **index_stats(rows)}
+            report.update(precision_report(table, qa_pairs, args.mode, args.k, embeddings))
+            print(json.dumps(report))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
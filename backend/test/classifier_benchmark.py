@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.query_classifier import QueryClassifier
+from services.local_classifier import (
+    LABELS_PATH,
+    NaiveBayesClassifier,
+    RuleClassifier,
+    classify_locally,
+    load_labelled_queries
+)
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+CLEAN_DATA_PATH = os.path.join(os.path.dirname(TEST_DIR), "data", "clean_data.json")
+QA_PAIRS_PATH = os.path.join(TEST_DIR, "qa_pairs.json")
+
+# Off-topic queries that share keywords with the rules; the pipeline must route them to "other"
+OFF_TOPIC_QUERIES = [
+    "How do I install Python on Windows?",
+    "How much does a flight to Paris cost?",
+    "Is it safe to travel to Mexico?",
+    "Compare iPhone vs Android",
+    "Do I need a permit to fish?",
+    "What are the specs of the new MacBook Pro?",
+    "Where can I buy cheap concert tickets?",
+    "How do I mount a TV on a bracket?",
+    "Which is better, Netflix or Hulu?",
+    "What certifications do I need to become a nurse?",
+    "Is it safe to eat raw cookie dough?",
+    "What's the weather like in Seattle today?"
+]
+
+def with_off_topic(examples: list) -> list:
+    """Add the off-topic queries, labelled "other", to LLM-labelled examples."""
+    labelled = {e['query'] for e in examples}
+    return examples + [{"query": q, "label": "other"} for q in OFF_TOPIC_QUERIES if q not in labelled]
+
+def collect_queries() -> list:
+    """Gather unique training queries from qa_pairs.json and the typical_queries in clean_data.json."""
+    with open(QA_PAIRS_PATH, 'r') as f:
+        queries = [pair['question'] for pair in json.load(f)]
+    with open(CLEAN_DATA_PATH, 'r') as f:
+        queries += [item['query'] for item in json.load(f).get('typical_queries', [])]
+    return list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+
+async def label_with_llm(classifier: QueryClassifier, queries: list) -> list:
+    """Label queries with the current LLM classifier in one abatch call."""
+    results = await classifier.aclassify_queries(queries)
+    return [{"query": q, "label": r.primary_type} for q, r in zip(queries, results)]
+
+def measure_llm_latency(classifier: QueryClassifier, queries: list, sample_size: int = 10) -> list:
+    """Time individual LLM classification calls (ms) on a sample of queries."""
+    latencies = []
+    for query in random.sample(queries, min(sample_size, len(queries))):
+        start = time.perf_counter()
+        classifier.classify_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def cross_validate(examples: list, threshold: float, folds: int = 5) -> dict:
+    """Score the local tiers against LLM labels with k-fold cross-validation."""
+    examples = examples[:]
+    random.Random(0).shuffle(examples)
+    rules = RuleClassifier()
+    counts = {"rules": [0, 0], "model": [0, 0], "llm": 0}
+    # "other" queries that a local tier sent to retrieval under a building-material type
+    other_total = other_misrouted = 0
+    latencies = []
+
+    for fold in range(folds):
+        test = examples[fold::folds]
+        train = [e for i, e in enumerate(examples) if i % folds != fold]
+        model = NaiveBayesClassifier().fit([e['query'] for e in train], [e['label'] for e in train])
+
+        for example in test:
+            start = time.perf_counter()
+            prediction, tier = classify_locally(example['query'], rules, model, threshold) or (None, "llm")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if tier == "llm":
+                counts["llm"] += 1
+            else:
+                counts[tier][0] += 1
+                counts[tier][1] += prediction == example['label']
+            if example['label'] == "other":
+                other_total += 1
+                other_misrouted += tier != "llm" and prediction != "other"
+
+    total = len(examples)
+    local_hits = counts["rules"][0] + counts["model"][0]
+    local_correct = counts["rules"][1] + counts["model"][1]
+    return {
+        "threshold": threshold,
+        "rules_hit_rate": counts["rules"][0] / total,
+        "rules_accuracy": counts["rules"][1] / counts["rules"][0] if counts["rules"][0] else None,
+        "model_hit_rate": counts["model"][0] / total,
+        "model_accuracy": counts["model"][1] / counts["model"][0] if counts["model"][0] else None,
+        "llm_fallback_rate": counts["llm"] / total,
+        # LLM fallbacks agree with the reference labels by definition
+        "overall_agreement": (local_correct + counts["llm"]) / total,
+        "local_accuracy": local_correct / local_hits if local_hits else None,
+        "other_misroute_rate": other_misrouted / other_total if other_total else None,
+        "local_p50_ms": statistics.median(latencies),
+        "local_p99_ms": sorted(latencies)[int(0.99 * (len(latencies) - 1))]
+    }
+
+def main():
+    load_dotenv()
+    random.seed(0)
+    queries = collect_queries()
+
+    # Reuse the committed labels unless asked to relabel; relabelling keeps the seed queries
+    examples = load_labelled_queries(LABELS_PATH)
+    classifier = None
+    if not examples or "--relabel" in sys.argv:
+        queries = list(dict.fromkeys(queries + [e['query'] for e in examples]))
+        classifier = QueryClassifier(os.getenv("OPENAI_API_KEY"))
+        print(f"Labelling {len(queries)} queries with the LLM classifier...")
+        examples = with_off_topic(asyncio.run(label_with_llm(classifier, queries)))
+        with open(LABELS_PATH, 'w') as f:
+            json.dump(examples, f, indent=2)
+        print(f"Saved labels to {LABELS_PATH}")
+
+    examples = with_off_topic(examples)
+    print(f"\n=== Local vs LLM classification ({len(examples)} labelled queries) ===")
+    for threshold in (0.6, 0.75, 0.85, 0.95):
+        report = cross_validate(examples, threshold)
+        print(json.dumps(report, indent=2))
+
+    if "--llm-latency" in sys.argv:
+        classifier = classifier or QueryClassifier(os.getenv("OPENAI_API_KEY"))
+        latencies = measure_llm_latency(classifier, queries)
+        print(f"\nLLM classification latency: p50={statistics.median(latencies):.1f} ms, "
+              f"max={max(latencies):.1f} ms over {len(latencies)} calls")
+
+if __name__ == "__main__":
+    main()
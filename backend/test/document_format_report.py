@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+import pandas as pd
+import pyarrow as pa
+import lancedb
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.process import (
+    CLEAN_DATA_PATH,
+    DATA_DIR,
+    ensure_fts_index,
+    iter_source_records,
+    make_text_splitter,
+    prepare_documents
+)
+from services.token_counter import count_tokens
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_CSV_PATH = os.path.join(DATA_DIR, "building_materials_docs.csv")
+QA_PAIRS_PATH = os.path.join(TEST_DIR, "qa_pairs.json")
+
+def load_legacy_rows(csv_path: str = LEGACY_CSV_PATH) -> list:
+    """(doc_type, text) rows of a table exported before the compact format."""
+    df = pd.read_csv(csv_path)
+    rows = []
+    for text, metadata in zip(df["text"], df["metadata"]):
+        # Metadata is a dict repr, whose list fields may be numpy array reprs literal_eval rejects
+        match = re.search(r"'doc_type': '([^']+)'", str(metadata))
+        rows.append((match.group(1) if match else "unknown", str(text)))
+    return rows
+
+def load_current_rows(source_path: str = CLEAN_DATA_PATH) -> list:
+    """(doc_type, text) rows the current formatters and normalization produce."""
+    docs = prepare_documents(list(iter_source_records(source_path)), make_text_splitter())
+    return [(doc["metadata"]["doc_type"], doc["content"]) for doc in docs]
+
+def text_stats(rows: list) -> dict:
+    """Chunks, UTF-8 bytes and tokens per doc type."""
+    stats = defaultdict(lambda: {"chunks": 0, "bytes": 0, "tokens": 0})
+    for doc_type, text in rows:
+        stats[doc_type]["chunks"] += 1
+        stats[doc_type]["bytes"] += len(text.encode("utf-8"))
+        stats[doc_type]["tokens"] += count_tokens(text)
+    return dict(stats)
+
+def _saved_pct(old: int, new: int) -> float:
+    return round(100 * (old - new) / old, 1) if old else 0.0
+
+def _size_row(doc_type: str, old: dict, new: dict) -> dict:
+    return {
+        "doc_type": doc_type,
+        "chunks": f"{old['chunks']} -> {new['chunks']}",
+        "bytes": f"{old['bytes']} -> {new['bytes']}",
+        "bytes_saved_pct": _saved_pct(old["bytes"], new["bytes"]),
+        "tokens": f"{old['tokens']} -> {new['tokens']}",
+        "tokens_saved_pct": _saved_pct(old["tokens"], new["tokens"])
+    }
+
+def savings_report(before: dict, after: dict) -> list:
+    """Per doc type (and total) sizes before and after, with the share saved."""
+    empty = {"chunks": 0, "bytes": 0, "tokens": 0}
+    totals = {"before": dict(empty), "after": dict(empty)}
+    reports = []
+    for doc_type in sorted(set(before) | set(after)):
+        old, new = before.get(doc_type, empty), after.get(doc_type, empty)
+        for key in empty:
+            totals["before"][key] += old[key]
+            totals["after"][key] += new[key]
+        reports.append(_size_row(doc_type, old, new))
+    reports.append(_size_row("TOTAL", totals["before"], totals["after"]))
+    return reports
+
+def content_words(text: str) -> set:
+    """Lowercased words and dotted/slashed tokens (2x4, 23/32, ...), ignoring punctuation."""
+    return set(re.findall(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*", text.lower()))
+
+def context_coverage(expected_context: str, retrieved: list) -> float:
+    """Share of the words in a QA pair's context that appear in the retrieved chunks.
+
+    Formatting differences (quotes, braces, indentation) do not count, so the
+    two formats are compared on content only.
+    """
+    expected = content_words(expected_context)
+    if not expected:
+        return 1.0
+    found = content_words(" ".join(retrieved))
+    return len(expected & found) / len(expected)
+
+def make_table(db, name: str, rows: list, embeddings=None):
+    texts = [text for _, text in rows]
+    columns = {"text": texts, "doc_type": [doc_type for doc_type, _ in rows]}
+    if embeddings is not None:
+        vectors = embeddings.embed_documents(texts)
+        columns["vector"] = pa.FixedSizeListArray.from_arrays(
+            pa.array([value for vector in vectors for value in vector], pa.float32()), len(vectors[0]))
+    table = db.create_table(name, data=pa.table(columns), mode="overwrite")
+    ensure_fts_index(table)
+    return table
+
+def search(table, mode: str, question: str, k: int, embeddings=None) -> list:
+    if mode == "fts":
+        query = table.search(question, query_type="fts")
+    elif mode == "vector":
+        query = table.search(embeddings.embed_query(question))
+    else:
+        query = table.search(query_type="hybrid").vector(embeddings.embed_query(question)).text(question)
+    return [row["text"] for row in query.limit(k).to_list()]
+
+def retrieval_report(before_rows: list, after_rows: list, qa_pairs: list,
+                     mode: str = "fts", k: int = 3) -> dict:
+    """Mean context coverage and hit rate (coverage >= 0.8) at k for both formats."""
+    embeddings = None
+    if mode != "fts":
+        from langchain_openai import OpenAIEmbeddings
+        from services.embedding_cache import CachedEmbeddings
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY")))
+
+    work_dir = tempfile.mkdtemp(prefix="format_report_")
+    try:
+        db = lancedb.connect(work_dir)
+        tables = {
+            "before": make_table(db, "before", before_rows, embeddings),
+            "after": make_table(db, "after", after_rows, embeddings)
+        }
+        questions = list({pair["question"]: pair for pair in qa_pairs}.values())
+        report = {"mode": mode, "k": k, "questions": len(questions)}
+        for name, table in tables.items():
+            coverages = []
+            for pair in questions:
+                retrieved = search(table, mode, pair["question"], k, embeddings)
+                coverages.append(context_coverage(pair.get("context", ""), retrieved))
+            report[name] = {
+                "mean_coverage": round(sum(coverages) / len(coverages), 4),
+                "hit_rate": round(sum(c >= 0.8 for c in coverages) / len(coverages), 4)
+            }
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Size and retrieval quality of the compact document format vs the legacy one")
+    parser.add_argument("--before", default=LEGACY_CSV_PATH, help="CSV export of a table in the legacy format")
+    parser.add_argument("--source", default=CLEAN_DATA_PATH)
+    parser.add_argument("--mode", choices=["fts", "vector", "hybrid"], default="fts",
+                        help="retrieval to compare; vector and hybrid embed both tables with OpenAI")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--skip-retrieval", action="store_true")
+    args = parser.parse_args()
+    load_dotenv()
+
+    before_rows = load_legacy_rows(args.before)
+    after_rows = load_current_rows(args.source)
+
+    print("=== Bytes and tokens per doc type ===")
+    for report in savings_report(text_stats(before_rows), text_stats(after_rows)):
+        print(json.dumps(report))
+
+    if not args.skip_retrieval:
+        with open(QA_PAIRS_PATH, "r") as file:
+            qa_pairs = json.load(file)
+        print("\n=== Retrieval quality on qa_pairs.json ===")
+        print(json.dumps(retrieval_report(before_rows, after_rows, qa_pairs, args.mode, args.k)))
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,266 @@
-from langchain_community.vectorstores import LanceDB
-from langchain_openai import OpenAIEmbeddings
-import lancedb
-from lancedb.rerankers import LinearCombinationReranker
+import argparse
+import json
 import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+import pyarrow as pa
+import lancedb
 from dotenv import load_dotenv
-import json
-import pandas as pd
-
-def load_qa_pairs(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-def evaluate_query(vector_store, question, expected_answer):
-    # Get top 3 results
-    results = vector_store.similarity_search_with_relevance_scores(question, k=3)
-    
-    print("\n=== Query Evaluation ===")
-    print(f"Question: {question}")
-    print(f"Expected Answer: {expected_answer}")
-    print("\nTop 3 Retrieved Results:")
-    
-    for i, (doc, score) in enumerate(results, 1):
-        print(f"\n{i}. Relevance Score: {score:.4f}")
-        print(f"Content: {doc}")
+from langchain_openai import OpenAIEmbeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.chunker import StructuredChunker
+from data.process import (
+    ANN_SEARCH_PARAMS,
+    CLEAN_DATA_PATH,
+    ensure_fts_index,
+    ensure_vector_index,
+    iter_source_records,
+    prepare_documents
+)
+from services.embedding_cache import CachedEmbeddings
+from document_format_report import QA_PAIRS_PATH, content_words
+
+# LinearCombinationReranker weight ChatService uses for hybrid search
+PRODUCTION_WEIGHT = 0.3
+
+def load_qa_pairs(file_path: str = QA_PAIRS_PATH) -> Tuple[List[str], List[Tuple[int, str]]]:
+    """Unique questions, and (question index, context) for each distinct context."""
+    with open(file_path, "r") as f:
+        qa_pairs = json.load(f)
+    questions: List[str] = []
+    contexts = {}
+    for pair in qa_pairs:
+        if pair["question"] not in questions:
+            questions.append(pair["question"])
+        contexts.setdefault((questions.index(pair["question"]), pair.get("context", "")), None)
+    return questions, list(contexts)
+
+def coverage_matrix(contexts: List[str], chunks: List[str]) -> np.ndarray:
+    """(contexts x chunks) share of each context's words that appear in each chunk."""
+    context_words = [content_words(context) for context in contexts]
+    vocabulary = {}
+    for words in context_words:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+
+    expected = np.zeros((len(contexts), len(vocabulary)), dtype=np.float32)
+    for i, words in enumerate(context_words):
+        expected[i, [vocabulary[word] for word in words]] = 1
+    found = np.zeros((len(chunks), len(vocabulary)), dtype=np.float32)
+    for j, chunk in enumerate(chunks):
+        found[j, [vocabulary[word] for word in content_words(chunk) if word in vocabulary]] = 1
+    return (expected @ found.T) / np.maximum(expected.sum(axis=1, keepdims=True), 1)
+
+def load_corpus(chunk_size: int, embeddings, source_path: str = CLEAN_DATA_PATH) -> Tuple[List[str], np.ndarray]:
+    """Chunks of the source data at `chunk_size` and their (cached) embeddings."""
+    text_splitter = StructuredChunker(chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+    texts = [doc["content"] for doc in prepare_documents(list(iter_source_records(source_path)), text_splitter)]
+    return texts, np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+def make_table(db, name: str, texts: List[str], vectors: np.ndarray):
+    data = pa.table({
+        "idx": pa.array(np.arange(len(texts))),
+        "text": texts,
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), vectors.shape[1])
+    })
+    table = db.create_table(name, data=data, mode="overwrite")
+    ensure_fts_index(table)
+    return table
+
+def exact_candidates(queries: np.ndarray, vectors: np.ndarray, depth: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-`depth` chunk indices and squared L2 distances (LanceDB's "l2" metric) per query."""
+    distances = (
+        (queries ** 2).sum(axis=1, keepdims=True) + (vectors ** 2).sum(axis=1) - 2 * queries @ vectors.T
+    )
+    indices = np.argsort(distances, axis=1, kind="stable")[:, :depth]
+    return indices, np.take_along_axis(distances, indices, axis=1)
+
+def ann_candidates(table, queries: np.ndarray, depth: int, nprobes: int,
+                   refine_factor: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """The same as exact_candidates through the table's ANN index, all queries in one search."""
+    search = table.search(list(queries)).limit(depth).select(["idx"]).nprobes(nprobes)
+    if refine_factor:
+        search = search.refine_factor(refine_factor)
+    rows = search.to_arrow()
+    return _pad_results(len(queries), depth, rows["query_index"].to_numpy(),
+                        rows["idx"].to_numpy(), rows["_distance"].to_numpy())
+
+def fts_candidates(table, questions: List[str], depth: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-`depth` chunk indices and BM25 scores per question (-1 / NaN padded)."""
+    query_index, indices, scores = [], [], []
+    for i, question in enumerate(questions):
+        try:
+            rows = table.search(question, query_type="fts").limit(depth).select(["idx"]).to_arrow()
+        except Exception as e:
+            print(f"Warning: full-text search failed for {question!r}: {str(e)}")
+            continue
+        query_index.extend([i] * rows.num_rows)
+        indices.extend(rows["idx"].to_pylist())
+        scores.extend(rows["_score"].to_pylist())
+    return _pad_results(len(questions), depth, np.asarray(query_index, dtype=np.int64),
+                        np.asarray(indices, dtype=np.int64), np.asarray(scores, dtype=np.float64))
+
+def _pad_results(n_queries: int, depth: int, query_index: np.ndarray, indices: np.ndarray,
+                 values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Flat (query, chunk, value) result rows, in rank order, as (n_queries x depth) arrays."""
+    padded_indices = np.full((n_queries, depth), -1, dtype=np.int64)
+    padded_values = np.full((n_queries, depth), np.nan)
+    order = np.argsort(query_index, kind="stable")
+    query_index, indices, values = query_index[order], indices[order], values[order]
+    # Position of each row within its query's results
+    starts = np.searchsorted(query_index, np.arange(n_queries))
+    positions = np.arange(len(query_index)) - starts[query_index]
+    keep = positions < depth
+    padded_indices[query_index[keep], positions[keep]] = indices[keep]
+    padded_values[query_index[keep], positions[keep]] = values[keep]
+    return padded_indices, padded_values
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    """Per-row min-max normalization over non-NaN entries, as LanceDB applies to each hybrid leg."""
+    low = np.nanmin(np.where(np.isnan(values), np.inf, values), axis=1, keepdims=True)
+    high = np.nanmax(np.where(np.isnan(values), -np.inf, values), axis=1, keepdims=True)
+    spread = high - low
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(spread > 0, (values - low) / np.where(spread > 0, spread, 1), values - low)
+
+def fuse(vector: Tuple[np.ndarray, np.ndarray], fts: Tuple[np.ndarray, np.ndarray],
+         k: int, weight: float, n_chunks: int) -> np.ndarray:
+    """Hybrid top-k per query: LinearCombinationReranker over each leg's top-k.
+
+    Scores are `weight * (1 - normalized distance) + (1 - weight) * normalized BM25`,
+    a leg missing a chunk contributing 0, exactly as LanceDB's hybrid query fuses them.
+    """
+    n_queries = vector[0].shape[0]
+    fused = np.zeros((n_queries, n_chunks))
+    candidate = np.zeros((n_queries, n_chunks), dtype=bool)
+    rows = np.broadcast_to(np.arange(n_queries)[:, None], (n_queries, k))
+    for (indices, values), scores, leg_weight in (
+        (vector, 1 - _min_max(vector[1][:, :k]), weight),
+        (fts, _min_max(fts[1][:, :k]), 1 - weight)
+    ):
+        indices = indices[:, :k]
+        valid = indices >= 0
+        fused[rows[valid], indices[valid]] += leg_weight * scores[valid]
+        candidate[rows[valid], indices[valid]] = True
+    fused[~candidate] = -np.inf
+    ranked = np.argsort(-fused, axis=1, kind="stable")[:, :k]
+    return np.where(np.take_along_axis(candidate, ranked, axis=1), ranked, -1)
+
+def _mean(values: np.ndarray) -> Optional[float]:
+    return round(float(values.mean()), 4) if values.size else None
+
+def score_rankings(ranked: np.ndarray, relevant: np.ndarray, context_hits: np.ndarray,
+                   context_question: np.ndarray) -> dict:
+    """Recall@k, MRR and nDCG@k of (questions x k) rankings, -1 padded.
+
+    `relevant` marks (questions x chunks) that match one of the question's
+    contexts; recall is the share of contexts (`context_hits`, contexts x
+    chunks) matched by at least one retrieved chunk. Contexts no chunk
+    matches, and questions left without any, are not scored.
+    """
+    k = ranked.shape[1]
+    valid = ranked >= 0
+    safe = np.where(valid, ranked, 0)
+    hits = np.take_along_axis(relevant, safe, axis=1) & valid
+
+    reciprocal_rank = np.where(hits.any(axis=1), 1.0 / (hits.argmax(axis=1) + 1), 0.0)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal_hits = np.minimum(relevant.sum(axis=1), k)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[ideal_hits]
+    ndcg = (hits * discounts).sum(axis=1) / np.where(ideal > 0, ideal, 1)
+
+    context_found = (
+        np.take_along_axis(context_hits, safe[context_question], axis=1) & valid[context_question]
+    ).any(axis=1)
+    scored = relevant.any(axis=1)
+    matched = context_hits.any(axis=1)
+    return {
+        f"recall@{k}": _mean(context_found[matched]),
+        "mrr": _mean(reciprocal_rank[scored]),
+        f"ndcg@{k}": _mean(ndcg[scored])
+    }
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(",")]
 
 def main():
-    # Load environment variables
+    parser = argparse.ArgumentParser(description="Retrieval quality (recall@k, MRR, nDCG) on every qa_pairs.json question")
+    parser.add_argument("--source", default=CLEAN_DATA_PATH)
+    parser.add_argument("--qa-pairs", default=QA_PAIRS_PATH)
+    parser.add_argument("--k", type=_int_list, default=[1, 3, 5, 10], help="comma-separated cutoffs")
+    parser.add_argument("--modes", default="vector,fts,hybrid")
+    parser.add_argument("--weights", type=_float_list, default=[PRODUCTION_WEIGHT],
+                        help="comma-separated reranker vector weights for hybrid search")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[1000])
+    parser.add_argument("--indexes", default="flat", help="comma-separated: flat, IVF_PQ, IVF_HNSW_SQ")
+    parser.add_argument("--nprobes", type=_int_list, default=[ANN_SEARCH_PARAMS["nprobes"]])
+    parser.add_argument("--refine-factor", type=int, default=ANN_SEARCH_PARAMS.get("refine_factor"))
+    parser.add_argument("--min-coverage", type=float, default=0.8,
+                        help="share of a context's words a chunk must contain to match it")
+    args = parser.parse_args()
     load_dotenv()
-    
-    # Initialize embeddings and reranker
-    embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-    reranker = LinearCombinationReranker(weight=0.3)
-    
-    # Load data from CSV
-    df = pd.read_csv("../data/building_materials_docs.csv")
-    
-    # Create vector store directly from the texts and metadata
-    texts = df['text'].tolist()
-    
-    vector_store = LanceDB.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        reranker=reranker
-    )
-    
-    # Load QA pairs
-    qa_pairs = load_qa_pairs('qa_pairs.json')
-    
-    # Test first 3 unique questions from QA pairs
-    tested_questions = set()
-    count = 0
-    
-    for pair in qa_pairs:
-        question = pair['question']
-        if question not in tested_questions and count < 3:
-            evaluate_query(vector_store, question, pair['answer'])
-            tested_questions.add(question)
-            count += 1
+
+    start = time.perf_counter()
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"), check_embedding_ctx_length=False))
+    questions, contexts = load_qa_pairs(args.qa_pairs)
+    context_question = np.array([question for question, _ in contexts])
+    # All questions in one batched (and cached) embedding call
+    queries = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+    modes = args.modes.split(",")
+    depth = max(args.k)
+
+    work_dir = tempfile.mkdtemp(prefix="evaluate_")
+    try:
+        db = lancedb.connect(work_dir)
+        for chunk_size in args.chunk_sizes:
+            texts, vectors = load_corpus(chunk_size, embeddings, args.source)
+            context_hits = coverage_matrix([context for _, context in contexts], texts) >= args.min_coverage
+            relevant = np.zeros((len(questions), len(texts)), dtype=bool)
+            np.logical_or.at(relevant, context_question, context_hits)
+            corpus = {"chunk_size": chunk_size, "chunks": len(texts),
+                      "unmatched_contexts": int((~context_hits.any(axis=1)).sum())}
+
+            table = make_table(db, f"chunks_{chunk_size}", texts, vectors)
+            fts = fts_candidates(table, questions, depth) if set(modes) & {"fts", "hybrid"} else None
+
+            for index in args.indexes.split(","):
+                if index == "flat":
+                    searches = [({"index": "flat"}, exact_candidates(queries, vectors, depth))]
+                elif ensure_vector_index(table, min_rows=0, index_type=index) is None:
+                    continue
+                else:
+                    searches = [
+                        ({"index": index, "nprobes": nprobes, "refine_factor": args.refine_factor},
+                         ann_candidates(table, queries, depth, nprobes, args.refine_factor))
+                        for nprobes in args.nprobes
+                    ]
+
+                for setting, vector in searches:
+                    for mode in modes:
+                        for weight in (args.weights if mode == "hybrid" else [None]):
+                            for k in args.k:
+                                if mode == "vector":
+                                    ranked = vector[0][:, :k]
+                                elif mode == "fts":
+                                    ranked = fts[0][:, :k]
+                                else:
+                                    ranked = fuse(vector, fts, k, weight, len(texts))
+                                report = {**corpus, **setting, "mode": mode,
+                                          **({"weight": weight} if weight is not None else {}), "k": k}
+                                report.update(score_rankings(ranked, relevant, context_hits, context_question))
+                                print(json.dumps(report))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps({"questions": len(questions), "contexts": len(contexts),
+                      "seconds": round(time.perf_counter() - start, 2)}))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TEST_DIR)
+QA_PAIRS_PATH = os.path.join(TEST_DIR, "qa_pairs.json")
+
+STAGE_METRIC = "buildmate_stage_duration_seconds"
+BUCKET_LINE = re.compile(r'^(\w+)_bucket\{(.*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float):
+    """Poll `url` until it answers, failing early if the process exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+def parse_histograms(text: str, metric: str = STAGE_METRIC, label: str = "stage") -> dict:
+    """{label value: {upper bound: cumulative count}} from Prometheus text output."""
+    histograms = defaultdict(dict)
+    for line in text.splitlines():
+        match = BUCKET_LINE.match(line)
+        if not match or match.group(1) != metric:
+            continue
+        labels = dict(LABEL.findall(match.group(2)))
+        bound = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+        histograms[labels.get(label, "")][bound] = float(match.group(3))
+    return dict(histograms)
+
+def histogram_delta(after: dict, before: dict) -> dict:
+    return {
+        key: {bound: count - before.get(key, {}).get(bound, 0.0) for bound, count in buckets.items()}
+        for key, buckets in after.items()
+    }
+
+def histogram_quantile(q: float, buckets: dict) -> float:
+    """Quantile estimate from cumulative buckets, interpolating linearly within a bucket."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return float("nan")
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+def memory_mb(pid: int) -> dict:
+    """Current and peak resident set size of a process (Linux /proc)."""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/status", "r") as file:
+            for line in file:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    usage["rss_mb" if name == "VmRSS" else "peak_rss_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return usage
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {f"p{q}": round(float(np.percentile(values, q)), 4) for q in (50, 95, 99)}
+
+async def send_request(client: httpx.AsyncClient, endpoint: str, query: str, session_id: str) -> dict:
+    body = {"messages": [{"role": "user", "content": query}], "session_id": session_id}
+    start = time.perf_counter()
+    if endpoint == "stream":
+        first_token = None
+        status = "error"
+        async with client.stream("POST", "/chat/stream", json=body) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("event: token") and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif line.startswith("event: done"):
+                    status = "success"
+        return {"latency": time.perf_counter() - start, "first_token": first_token, "status": status}
+    response = await client.post("/chat", json=body)
+    status = response.json().get("status", "error") if response.status_code == 200 else "error"
+    return {"latency": time.perf_counter() - start, "status": status}
+
+async def run_level(base_url: str, endpoint: str, concurrency: int, requests: int,
+                    queries: list, level_id: str, unique: bool) -> dict:
+    """Send `requests` chat requests with `concurrency` in flight; return client-side results."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def one(i: int) -> dict:
+            query = queries[i % len(queries)]
+            if unique:
+                # Distinct text per request, so the semantic response cache never answers
+                query = f"{query} (request {level_id}-{i})"
+            async with semaphore:
+                return await send_request(client, endpoint, query, f"load-{level_id}-{i}")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [r["latency"] for r in results]
+    report = {
+        "requests": requests,
+        "errors": sum(r["status"] != "success" for r in results),
+        "req_per_s": round(requests / elapsed, 2),
+        "latency_s": percentiles(latencies),
+        "mean_latency_s": round(float(np.mean(latencies)), 4)
+    }
+    first_tokens = [r["first_token"] for r in results if r.get("first_token") is not None]
+    if first_tokens:
+        report["first_token_s"] = percentiles(first_tokens)
+    return report
+
+def stage_report(before: str, after: str) -> dict:
+    """p50/p95/p99 per pipeline stage over the requests between two /metrics scrapes."""
+    stages = {}
+    for stage, buckets in sorted(histogram_delta(parse_histograms(after), parse_histograms(before)).items()):
+        count = buckets.get(float("inf"), 0)
+        if count:
+            stages[stage] = {"count": int(count),
+                             **{f"p{q}": round(histogram_quantile(q / 100, buckets), 4) for q in (50, 95, 99)}}
+    return stages
+
+def start_stack(work_dir: str, args) -> tuple:
+    """Start the OpenAI stub and the FastAPI app against it; return (stub, server, base_url)."""
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(TEST_DIR, "openai_stub.py"), "--port", str(stub_port),
+         "--chat-latency", str(args.chat_latency), "--token-latency", str(args.token_latency),
+         "--completion-tokens", str(args.completion_tokens), "--structured-latency", str(args.structured_latency),
+         "--embedding-latency", str(args.embedding_latency)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for(f"http://127.0.0.1:{stub_port}/stub/stats", stub, timeout=30)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{stub_port}/v1",
+        # A throwaway index, export and embedding cache; stub vectors never reach the real ones
+        "BUILDMATE_DB_PATH": os.path.join(work_dir, "db"),
+        "BUILDMATE_EXPORT_DIR": os.path.join(work_dir, "export"),
+        "BUILDMATE_EMBEDDING_CACHE": os.path.join(work_dir, "embedding_cache.sqlite3"),
+        "BUILDMATE_TRACE_SAMPLE_RATE": str(args.trace_sample_rate)
+    })
+    log_file = open(os.path.join(work_dir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    # Startup builds the index from clean_data.json through the stub
+    wait_for(f"{base_url}/welcome", server, timeout=args.startup_timeout)
+    return stub, server, base_url
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the chat API against a local OpenAI stub")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level (default: 8 x concurrency, at least 20)")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--repeat-queries", action="store_true", help="reuse query texts, letting the response cache answer")
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--structured-latency", type=float, default=0.15)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--trace-sample-rate", type=float, default=0.0)
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--max-mean-latency", type=float, default=None,
+                        help="fail if any level's mean latency exceeds this many seconds (README: 2)")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="fail if the server's peak RSS exceeds this (README: 512)")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (index, server.log)")
+    args = parser.parse_args()
+
+    with open(QA_PAIRS_PATH, "r") as file:
+        queries = list(dict.fromkeys(pair["question"] for pair in json.load(file)))
+
+    work_dir = tempfile.mkdtemp(prefix="buildmate_load_")
+    stub = server = None
+    failures = []
+    try:
+        stub, server, base_url = start_stack(work_dir, args)
+        print(json.dumps({"event": "started", "work_dir": work_dir, **memory_mb(server.pid)}))
+
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            requests = args.requests or max(20, 8 * concurrency)
+            before = httpx.get(f"{base_url}/metrics").text
+            report = asyncio.run(run_level(base_url, args.endpoint, concurrency, requests, queries,
+                                           f"c{concurrency}", unique=not args.repeat_queries))
+            after = httpx.get(f"{base_url}/metrics").text
+            report = {"concurrency": concurrency, "endpoint": args.endpoint, **report,
+                      "stages_s": stage_report(before, after), **memory_mb(server.pid)}
+            print(json.dumps(report))
+
+            if args.max_mean_latency is not None and report["mean_latency_s"] > args.max_mean_latency:
+                failures.append(f"concurrency {concurrency}: mean latency {report['mean_latency_s']}s > {args.max_mean_latency}s")
+            if report["errors"]:
+                failures.append(f"concurrency {concurrency}: {report['errors']} failed requests")
+
+        peak = memory_mb(server.pid).get("peak_rss_mb")
+        if args.max_rss_mb is not None and peak is not None and peak > args.max_rss_mb:
+            failures.append(f"peak RSS {peak} MB > {args.max_rss_mb} MB")
+    finally:
+        for process in (server, stub):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
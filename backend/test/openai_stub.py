@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# A canned answer, repeated to the requested completion length
+ANSWER_WORDS = (
+    "Pressure treated lumber should be cut outdoors while wearing safety glasses, a dust mask and gloves. "
+    "Seal cut ends with preservative and use hot-dipped galvanized or stainless steel fasteners."
+).split()
+
+class StubConfig:
+    """Simulated OpenAI latencies (seconds) and response sizes."""
+
+    def __init__(self, chat_latency: float = 0.3, token_latency: float = 0.01,
+                 completion_tokens: int = 60, structured_latency: float = 0.15,
+                 embedding_latency: float = 0.05, embedding_dimensions: int = 1536):
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.completion_tokens = completion_tokens
+        self.structured_latency = structured_latency
+        self.embedding_latency = embedding_latency
+        self.embedding_dimensions = embedding_dimensions
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+def stub_embedding(text: str, dimensions: int) -> list:
+    """Deterministic unit vector for a text, so equal texts embed equally across runs."""
+    vector = np.random.default_rng(_stable_hash(text)).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def _last_user_message(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content)
+    return ""
+
+def fill_schema(schema: dict, seed_text: str) -> dict:
+    """An object satisfying a JSON schema's string/number/bool/enum properties.
+
+    String fields whose description lists choices, e.g. "(safety/installation/other)",
+    get one of them, picked deterministically from the query.
+    """
+    result = {}
+    for name, prop in schema.get("properties", {}).items():
+        prop_type = prop.get("type")
+        if "enum" in prop:
+            choices = prop["enum"]
+        else:
+            listed = re.search(r"\(([\w-]+(?:/[\w-]+)+)\)", prop.get("description", ""))
+            choices = listed.group(1).split("/") if listed else None
+        if choices:
+            result[name] = choices[_stable_hash(seed_text + name) % len(choices)]
+        elif prop_type in ("integer", "number"):
+            result[name] = 0
+        elif prop_type == "boolean":
+            result[name] = False
+        elif prop_type == "array":
+            result[name] = []
+        elif prop_type == "object":
+            result[name] = fill_schema(prop, seed_text)
+        else:
+            result[name] = f"stub {name} {_stable_hash(seed_text + name) % 100000}"
+    return result
+
+def completion_text(n_tokens: int) -> list:
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(n_tokens)]
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = {"chat": 0, "structured": 0, "embeddings": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        query = _last_user_message(messages)
+        prompt_tokens = sum(len(json.dumps(m)) for m in messages) // 4
+        created = int(time.time())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = body.get("model", "gpt-4o-mini")
+
+        response_format = body.get("response_format") or {}
+        tools = body.get("tools") or []
+        functions = body.get("functions") or []
+        if response_format.get("type") == "json_schema" or tools or functions:
+            # Structured output: json_schema response format, a forced tool call or a legacy function call
+            app.state.requests["structured"] += 1
+            await asyncio.sleep(config.structured_latency)
+            if functions:
+                function = functions[0]
+                arguments = json.dumps(fill_schema(function.get("parameters", {}), query))
+                message = {"role": "assistant", "content": None,
+                           "function_call": {"name": function["name"], "arguments": arguments}}
+                finish_reason = "function_call"
+            elif tools:
+                function = tools[0]["function"]
+                arguments = json.dumps(fill_schema(function.get("parameters", {}), query))
+                message = {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                    "function": {"name": function["name"], "arguments": arguments}
+                }]}
+                finish_reason = "tool_calls"
+            else:
+                schema = response_format["json_schema"].get("schema", {})
+                message = {"role": "assistant", "content": json.dumps(fill_schema(schema, query))}
+                finish_reason = "stop"
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": _usage(prompt_tokens, 8)
+            })
+
+        app.state.requests["chat"] += 1
+        tokens = completion_text(config.completion_tokens)
+        if not body.get("stream"):
+            await asyncio.sleep(config.chat_latency + config.token_latency * len(tokens))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                             "finish_reason": "stop"}],
+                "usage": _usage(prompt_tokens, len(tokens))
+            })
+
+        async def events():
+            def chunk(delta: dict, finish_reason=None) -> str:
+                return "data: " + json.dumps({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }) + "\n\n"
+
+            await asyncio.sleep(config.chat_latency)
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(config.token_latency)
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        app.state.requests["embeddings"] += 1
+        await asyncio.sleep(config.embedding_latency)
+        dimensions = body.get("dimensions") or config.embedding_dimensions
+        data = [
+            {"object": "embedding", "index": i,
+             "embedding": stub_embedding(text if isinstance(text, str) else json.dumps(text), dimensions)}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        return JSONResponse({
+            "object": "list", "data": data, "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    @app.get("/stub/stats")
+    async def stats():
+        return app.state.requests
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat, structured-output and embeddings APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per streamed token")
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--structured-latency", type=float, default=0.15)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-dimensions", type=int, default=1536)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = StubConfig(args.chat_latency, args.token_latency, args.completion_tokens,
+                        args.structured_latency, args.embedding_latency, args.embedding_dimensions)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
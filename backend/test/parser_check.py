@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data.parser import BuildingDataParser
+from data.process import CLEAN_DATA_PATH, DATA_DIR
+
+RAW_DATA_PATH = os.path.join(DATA_DIR, "raw_data.txt")
+
+# Inputs iter_records must reject rather than parse into something plausible
+MALFORMED_INPUTS = {
+    "list without commas": "sample_dataset = {'sizes': [1 2]}",
+    "dict without commas": "sample_dataset = {'specs': [{'a': 1 'b': 2}]}",
+    "records without commas": "sample_dataset = {'products': [{'id': 'A'} {'id': 'B'}]}",
+    "sections without commas": "sample_dataset = {'a': [1] 'b': [2]}",
+    "unterminated string": "sample_dataset = {'a': ['open]}",
+    "unclosed list": "sample_dataset = {'a': [1, 2",
+    "missing colon": "sample_dataset = {'a' [1]}",
+    "bare name": "sample_dataset = {'a': [undefined]}"
+}
+
+def check_malformed(data_parser: BuildingDataParser, chunk_sizes: list, work_dir: str) -> list:
+    """Failures for malformed inputs that parse, or that leave a partial save_json_stream output."""
+    failures = []
+    for name, text in MALFORMED_INPUTS.items():
+        raw_path = os.path.join(work_dir, "malformed.txt")
+        with open(raw_path, "w") as file:
+            file.write(text)
+        for chunk_size in chunk_sizes:
+            try:
+                records = list(data_parser.iter_records(raw_path, chunk_size=chunk_size))
+                failures.append(f"{name} (chunk_size={chunk_size}): parsed as {records!r}")
+            except ValueError:
+                pass
+
+        # A failed stream must keep the previous output rather than truncate it
+        output_path = os.path.join(work_dir, "malformed.json")
+        with open(output_path, "w") as file:
+            file.write("{}")
+        saved = data_parser.save_json_stream(data_parser.iter_records(raw_path), output_path)
+        with open(output_path, "r") as file:
+            previous = file.read()
+        if saved or previous != "{}" or os.path.exists(f"{output_path}.tmp"):
+            failures.append(f"{name}: save_json_stream replaced or left behind a partial file")
+    return failures
+
+def dataset_records(data: dict) -> list:
+    """(section, record) pairs in the order iter_records yields them from a parsed dataset."""
+    return [
+        (section, record)
+        for section, value in data.items()
+        for record in (value if isinstance(value, list) else [value])
+    ]
+
+def compare_records(actual: list, expected: list) -> str:
+    """Describe the first differing (section, record) pair, or "" if the sequences are equal."""
+    for i, ((section, record), (expected_section, expected_record)) in enumerate(zip(actual, expected)):
+        if section != expected_section:
+            return f"record {i}: section {section!r}, expected {expected_section!r}"
+        difference = first_difference(record, expected_record, f"{section}[{i}]")
+        if difference:
+            return difference
+    if len(actual) != len(expected):
+        return f"{len(actual)} records, expected {len(expected)}"
+    return ""
+
+def first_difference(actual, expected, path: str = "") -> str:
+    """Describe where two parsed datasets first differ, or "" if they are equal."""
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        for key in list(dict.fromkeys([*expected, *actual])):
+            if key not in actual:
+                return f"{path}/{key}: missing"
+            if key not in expected:
+                return f"{path}/{key}: unexpected"
+            difference = first_difference(actual[key], expected[key], f"{path}/{key}")
+            if difference:
+                return difference
+        return ""
+    if isinstance(actual, list) and isinstance(expected, list):
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            difference = first_difference(a, e, f"{path}[{i}]")
+            if difference:
+                return difference
+        if len(actual) != len(expected):
+            return f"{path}: {len(actual)} items, expected {len(expected)}"
+        return ""
+    if actual != expected:
+        return f"{path}: {actual!r} != {expected!r}"
+    return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the streaming parser against parse_file and clean_data.json")
+    parser.add_argument("--raw", default=RAW_DATA_PATH)
+    parser.add_argument("--clean", default=CLEAN_DATA_PATH)
+    parser.add_argument("--chunk-sizes", default="1,7,64,4096,65536",
+                        help="comma-separated scanner buffer sizes; small ones split every token across reads")
+    args = parser.parse_args()
+
+    data_parser = BuildingDataParser()
+    parsed = data_parser.parse_file(args.raw)
+    if parsed is None:
+        print(f"FAILED: parse_file could not parse {args.raw}")
+        sys.exit(1)
+    with open(args.clean, "r") as file:
+        references = {"parse_file": dataset_records(parsed), "clean_data.json": dataset_records(json.load(file))}
+
+    failures = []
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(",")]
+    for chunk_size in chunk_sizes:
+        try:
+            streamed = list(data_parser.iter_records(args.raw, chunk_size=chunk_size))
+        except ValueError as e:
+            failures.append(f"iter_records(chunk_size={chunk_size}) raised: {str(e)}")
+            continue
+        for name, expected in references.items():
+            difference = compare_records(streamed, expected)
+            if difference:
+                failures.append(f"iter_records(chunk_size={chunk_size}) vs {name}: {difference}")
+        sections = len(dict.fromkeys(section for section, _ in streamed))
+        print(json.dumps({"chunk_size": chunk_size, "sections": sections, "records": len(streamed)}))
+
+    # The streaming writer must round-trip what the streaming reader yields
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, "stream.json")
+        data_parser.save_json_stream(data_parser.iter_records(args.raw), output_path)
+        with open(output_path, "r") as file:
+            difference = compare_records(dataset_records(json.load(file)), references["parse_file"])
+        if difference:
+            failures.append(f"save_json_stream vs parse_file: {difference}")
+        failures += check_malformed(data_parser, chunk_sizes, work_dir)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if not failures:
+        print(f"iter_records matches parse_file and clean_data.json, and rejects {len(MALFORMED_INPUTS)} malformed inputs")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
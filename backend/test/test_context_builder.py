@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import context_builder
+from services.context_builder import ContextBuilder, compact_text
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """Count one token per word, so budgets don't depend on the tokenizer being downloadable."""
+    monkeypatch.setattr(context_builder, "count_tokens", lambda text, model=None: len(text.split()))
+
+def chunk(source_id: str, index: int, text: str) -> Document:
+    return Document(id=f"technical_document:{source_id}:{index}:abc123", page_content=text)
+
+def lines(count: int, label: str) -> str:
+    """`count` lines of three words each."""
+    return "\n".join(f"{label} line {i}" for i in range(count))
+
+def test_empty_docs_build_nothing():
+    assert ContextBuilder(max_tokens=100).build([]) == ("", 0)
+
+def test_documents_within_budget_are_kept_whole():
+    docs = [chunk("a", 0, lines(3, "alpha")), chunk("b", 0, lines(3, "beta"))]
+    context, tokens = ContextBuilder(max_tokens=100).build(docs)
+
+    assert context == lines(3, "alpha") + "\n\n" + lines(3, "beta")
+    # 9 words each, plus one for the blank line between them
+    assert tokens == 19
+
+def test_last_document_is_cut_at_a_line_boundary():
+    docs = [chunk("a", 0, lines(4, "alpha")), chunk("b", 0, lines(10, "beta")), chunk("c", 0, "never reached")]
+    context, tokens = ContextBuilder(max_tokens=25).build(docs)
+
+    # The first document and the separator take 13 tokens, leaving room for four lines of the second
+    assert context == lines(4, "alpha") + "\n\n" + lines(4, "beta")
+    assert tokens == 25
+    assert "never reached" not in context
+
+def test_returned_tokens_never_exceed_budget():
+    docs = [chunk(str(i), 0, lines(5, f"doc{i}")) for i in range(10)]
+    for budget in (1, 7, 15, 16, 17, 40, 100):
+        context, tokens = ContextBuilder(max_tokens=budget).build(docs)
+        assert tokens <= budget
+        assert len(context.split()) <= budget
+
+def test_first_document_larger_than_budget_is_truncated():
+    context, tokens = ContextBuilder(max_tokens=10).build([chunk("a", 0, lines(10, "alpha"))])
+    assert context == lines(3, "alpha")
+    assert tokens == 9
+
+def test_consecutive_chunks_are_merged_without_overlap():
+    first = "Header\nstep one\nstep two\nstep three"
+    second = "Header\nstep two\nstep three\nstep four"
+    context, _ = ContextBuilder(max_tokens=100).build([chunk("a", 1, second), chunk("a", 0, first)])
+    assert context == "Header\nstep one\nstep two\nstep three\nstep four"
+
+def test_duplicate_chunks_and_texts_are_dropped():
+    docs = [chunk("a", 0, "same text"), chunk("a", 0, "same text"), chunk("b", 0, "  same text  ")]
+    assert ContextBuilder(max_tokens=100).build(docs) == ("same text", 2)
+
+def test_compact_text_strips_padding_and_blank_runs():
+    assert compact_text("\n    first\n\n\n      second   \n\n") == "first\n\nsecond"
@@ -0,0 +1,117 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import session_memory
+from services.session_memory import MESSAGE_TOKEN_OVERHEAD, SessionMemoryStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """Count one token per word, so budgets don't depend on the tokenizer being downloadable."""
+    monkeypatch.setattr(session_memory, "count_tokens", lambda text, model=None: len(text.split()))
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(session_memory.time, "monotonic", fake)
+    return fake
+
+def message(words: int, label: str = "w") -> str:
+    """A message costing `words` + MESSAGE_TOKEN_OVERHEAD tokens."""
+    return " ".join(f"{label}{i}" for i in range(words))
+
+def contents(history) -> list:
+    return [m.content for m in history]
+
+def test_save_turn_trims_oldest_turns_to_session_budget():
+    store = SessionMemoryStore(max_tokens_per_session=3 * (6 + MESSAGE_TOKEN_OVERHEAD))
+    for turn in range(3):
+        store.save_turn("s", message(6, f"q{turn}-"), message(6, f"a{turn}-"))
+
+    history, tokens = store.get_history_with_tokens("s", [])
+    # Three 10-token messages fit; the whole first turn and the second query were dropped
+    assert contents(history) == [message(6, "a1-"), message(6, "q2-"), message(6, "a2-")]
+    assert tokens == 30
+    assert store.stats()["total_tokens"] == 30
+
+def test_history_is_rebuilt_from_client_messages_within_budget():
+    store = SessionMemoryStore(max_tokens_per_session=25)
+    client_messages = [
+        {"role": "user", "content": message(8, "old")},
+        {"role": "assistant", "content": message(8, "older-answer")},
+        {"role": "system", "content": message(2, "sys")},
+        {"role": "user", "content": ""},
+        {"role": "user", "content": message(6, "recent")},
+        {"role": "assistant", "content": message(6, "latest")}
+    ]
+
+    history, tokens = store.get_history_with_tokens("s", client_messages)
+    # Newest turns first until the budget runs out, returned in chronological order
+    assert contents(history) == [message(6, "recent"), message(6, "latest")]
+    assert [m.type for m in history] == ["human", "ai"]
+    assert tokens == 20
+    assert store.stats() == {"sessions": 1, "total_tokens": 20, "evictions": 0}
+
+    # Once rebuilt, the stored session wins over the client's copy
+    history, _ = store.get_history_with_tokens("s", [{"role": "user", "content": "ignored"}])
+    assert contents(history) == [message(6, "recent"), message(6, "latest")]
+
+def test_requests_without_session_id_are_not_stored():
+    store = SessionMemoryStore()
+    history, tokens = store.get_history_with_tokens(None, [{"role": "user", "content": "hello there"}])
+    store.save_turn(None, "query", "response")
+
+    assert contents(history) == ["hello there"]
+    assert tokens == 2 + MESSAGE_TOKEN_OVERHEAD
+    assert store.stats() == {"sessions": 0, "total_tokens": 0, "evictions": 0}
+
+def test_global_token_cap_evicts_least_recently_used_sessions():
+    store = SessionMemoryStore(max_tokens_per_session=100, max_total_tokens=45)
+    for session_id in ("a", "b"):
+        store.save_turn(session_id, message(6), message(6))
+    store.get_history_with_tokens("a", [])  # "b" is now least recently used
+    store.save_turn("c", message(6), message(6))
+
+    stats = store.stats()
+    assert stats == {"sessions": 2, "total_tokens": 40, "evictions": 1}
+    # An evicted session comes back from the client's messages
+    history, _ = store.get_history_with_tokens("b", [{"role": "user", "content": "resent"}])
+    assert contents(history) == ["resent"]
+
+def test_max_sessions_evicts_least_recently_used():
+    store = SessionMemoryStore(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        store.save_turn(session_id, "query", "response")
+
+    assert store.stats()["sessions"] == 2
+    assert contents(store.get_history_with_tokens("a", [])[0]) == []
+    assert contents(store.get_history_with_tokens("c", [])[0]) == ["query", "response"]
+
+def test_idle_sessions_expire_after_ttl(clock):
+    store = SessionMemoryStore(session_ttl=60)
+    store.save_turn("idle", "query", "response")
+    clock.now += 30
+    store.save_turn("active", "query", "response")
+
+    clock.now += 45  # "idle" is 75s old, "active" 45s
+    store.get_history_with_tokens("active", [])
+    assert store.stats()["sessions"] == 1
+    assert store.stats()["evictions"] == 1
+    assert contents(store.get_history_with_tokens("idle", [])[0]) == []
+
+def test_access_refreshes_ttl(clock):
+    store = SessionMemoryStore(session_ttl=60)
+    store.save_turn("s", "query", "response")
+    for _ in range(3):
+        clock.now += 50
+        history, _ = store.get_history_with_tokens("s", [])
+        assert contents(history) == ["query", "response"]
+    assert store.stats()["evictions"] == 0
@@ -27,6 +27,7 @@ export default function ChatInterface() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const messagesEndRef = useRef(null);
+  const sessionIdRef = useRef(crypto.randomUUID());
   
   useEffect(() => {
     // Fetch welcome message when component mounts
@@ -63,14 +64,66 @@ export default function ChatInterface() {
     setMessages(prev => [...prev, userMessage]);
     setInput('');
 
+    const assistantMessage = {
+      id: `pending-${Date.now()}`,
+      role: 'assistant',
+      content: '',
+      createTime: Date.now(),
+    };
+    const updateAssistantMessage = (update) => {
+      setMessages(prev => prev.map(message => (
+        message.id === assistantMessage.id ? { ...message, ...update(message) } : message
+      )));
+    };
+    setMessages(prev => [...prev, assistantMessage]);
+
     try {
-      const response = await axios.post('http://localhost:8000/chat', {
-        messages: [...messages, userMessage],
+      const response = await fetch('http://localhost:8000/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          messages: [...messages, userMessage],
+          session_id: sessionIdRef.current,
+        }),
       });
+      if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
 
-      setMessages(prev => [...prev, response.data]);
+      // Parse server-sent events as they arrive: "event: <type>\ndata: <json>\n\n"
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          const type = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] ?? '{}');
+          if (type === 'token') {
+            updateAssistantMessage(message => ({ content: message.content + data.content }));
+          } else if (type === 'done' || type === 'error') {
+            updateAssistantMessage(() => data);
+            finished = true;
+          }
+        }
+      }
+      if (!finished) {
+        throw new Error('Stream ended before the response was complete');
+      }
     } catch (error) {
       console.error('Error:', error);
+      // Replace the pending bubble, as the stream's own error event does
+      updateAssistantMessage(() => ({
+        content: 'I apologize, but I could not get a response. Please check your connection and try again.',
+        createTime: Date.now(),
+        status: 'error',
+        error: error.message,
+      }));
     }
   };
 